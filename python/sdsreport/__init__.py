@@ -0,0 +1,34 @@
+"""
+make reports of SDS sanitization latency from logs
+
+    import sdsreport
+    for row in sdsreport.build_report("C:/SDS/Logs/*log*"):
+        print(row["ItemID"], row["TotalProcessSeconds"])
+
+the modules are imported on the first use of these names, so importing the package is cheap,
+and the compiled patterns are kept for the later calls
+
+    parse       log lines into records and thread events
+    cache       parse result of each log
+    report      reading logs through the cache, joining the events to the items, the report csv
+    stream      rows of items as soon as they are complete (--stream, --follow)
+    summary     duration percentiles (--summary)
+    timeline    item states per second (--timeline)
+    db          SQLite database (--db)
+    compare     comparison of two runs (report.py compare)
+    cli         command line of report.py and python -m sdsreport
+"""
+
+# names available on the package and the modules they are in
+api_module_dic = {"parse_logs": "report", "build_report": "report", "make_report_rows": "report",
+                  "write_report": "report", "report_fields": "report", "Record": "parse",
+                  "VersionNotFoundError": "parse"}
+
+__all__ = list(api_module_dic)
+
+
+def __getattr__(name):
+    if name in api_module_dic:
+        import importlib
+        return getattr(importlib.import_module("." + api_module_dic[name], __name__), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import argparse
+import itertools
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from time import perf_counter
+
+if not __package__:
+    # run as a script, like report.py
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = "sdsreport"
+
+from . import parse
+from . import report
+from . import cli
+from . import gen_log
+
+
+# SDS versions to benchmark, one for each status line format
+bench_version_list = ["7.3", "7.4"]
+
+# metrics compared with the baseline, higher is better
+gate_metric_list = ["lines_per_sec", "items_per_sec"]
+
+# lines at the head of each log which the microbenchmarks run on
+micro_lines = 200000
+
+
+def run_case(log, version, jobs, report_name):
+    """
+    run parse, join and write of report.py over a log once and measure them
+    it runs in a fresh process, so the peak RSS is of this case only
+    :return: dictionary of the measurements
+    """
+    with open(log, "rb") as f:
+        lines = sum(block.count(b"\n") for block in iter(lambda: f.read(1024 * 1024), b""))
+    result = {"version": version, "jobs": jobs, "bytes": os.path.getsize(log), "lines": lines}
+
+    t0 = perf_counter()
+    versions = parse.detect_versions([log])
+    report_dic, sanitization_done_dic, ftd_dic = report.read_logs([log], versions, jobs)
+    t1 = perf_counter()
+    rows = list(report.make_report_rows(report_dic, sanitization_done_dic, ftd_dic))
+    t2 = perf_counter()
+    report.write_report(report_name, rows, 1024 * 1024)
+    t3 = perf_counter()
+
+    result["items"] = len(rows)
+    result["parse_sec"] = round(t1 - t0, 3)
+    result["join_sec"] = round(t2 - t1, 3)
+    result["write_sec"] = round(t3 - t2, 3)
+    result["total_sec"] = round(t3 - t0, 3)
+    result["lines_per_sec"] = round(lines / (t3 - t0))
+    result["items_per_sec"] = round(len(rows) / (t3 - t0))
+    result["peak_rss_mb"] = cli.get_peak_rss()
+    return result
+
+
+def best_time(func, repeat):
+    """
+    :return: seconds of the fastest of repeat calls of func
+    """
+    times = []
+    for _ in range(repeat):
+        t0 = perf_counter()
+        func()
+        times.append(perf_counter() - t0)
+    return min(times)
+
+
+def count_fragment(fragment):
+    """
+    :return: [items, SanitizationDone events, FTD events] of a parse result
+    """
+    return [len(fragment[0])] + [sum(map(len, event_dic.values())) for event_dic in fragment[1:]]
+
+
+def run_micro(log, version, repeat):
+    """
+    time parse.parse_time against datetime.strptime on the times of the lines,
+    and the marker prefilter of parse.parse_lines (lines of compressed logs) and of parse.parse_buffer
+    (bytes of plain logs) against matching every pattern on every line, over the first micro_lines lines of a log
+    :return: dictionary of the measurements
+    """
+    with parse.open_log(log, exact=True) as f:
+        lines = list(itertools.islice(f, micro_lines))
+    times = []
+    for line in lines:
+        m = parse.regex_line_time.match(line[:64].encode())
+        if m:
+            times.append(m.group(1).decode())
+
+    def parse_times():
+        # the prefix cache starts empty, as for a new log
+        parse.time_prefix_cache.clear()
+        for text in times:
+            parse.parse_time(text)
+
+    def strptime_times():
+        for text in times:
+            datetime.strptime(text, "%d/%m/%Y %H:%M:%S.%f")
+
+    regex_list = [regex for regex, _ in parse.get_dispatch_list(version)]
+
+    def prefilter():
+        return parse.parse_lines(parse.offset_lines(lines), version)
+
+    data = "".join(lines).encode()
+    byte_dispatch_list = [(regex, marker.encode()) for regex, marker in parse.get_dispatch_list(version)]
+
+    def prefilter_bytes():
+        fragment = ({}, {}, {})
+        parse.parse_buffer(data, 0, len(data), 0, byte_dispatch_list, fragment)
+        return fragment
+
+    def all_regex():
+        # every pattern on every line, as report.py did before the prefilter
+        fragment = ({}, {}, {})
+        for line in lines:
+            for regex in regex_list:
+                parse.make_record(regex, line, fragment)
+        return fragment
+
+    if not count_fragment(prefilter()) == count_fragment(prefilter_bytes()) == count_fragment(all_regex()):
+        raise AssertionError("the prefilter and matching every pattern parse {} differently".format(log))
+
+    result = {"version": version, "lines": len(lines), "times": len(times),
+              "strptime_sec": round(best_time(strptime_times, repeat), 3),
+              "parse_time_sec": round(best_time(parse_times, repeat), 3),
+              "all_regex_sec": round(best_time(all_regex, repeat), 3),
+              "prefilter_sec": round(best_time(prefilter, repeat), 3),
+              "prefilter_bytes_sec": round(best_time(prefilter_bytes, repeat), 3)}
+    result["parse_time_speedup"] = round(result["strptime_sec"] / result["parse_time_sec"], 1)
+    result["prefilter_speedup"] = round(result["all_regex_sec"] / result["prefilter_sec"], 1)
+    result["prefilter_bytes_speedup"] = round(result["all_regex_sec"] / result["prefilter_bytes_sec"], 1)
+    return result
+
+
+def write_log(log, args, version):
+    """
+    write a synthetic log of the given SDS version with the generator parameters of args
+    """
+    with open(log, 'w', encoding='utf_8', buffering=1024 * 1024) as f:
+        for line in gen_log.generate_lines(args.items, args.threads, version, args.ftd_fanout, args.block_ratio,
+                                           args.noise_ratio, args.seed):
+            f.write(line)
+            f.write("\n")
+
+
+def compare_results(results, baseline, tolerance):
+    """
+    compare the throughput with a saved baseline
+    :return: list of messages of the metrics which got slower than tolerance allows
+    """
+    regressions = []
+    base_dic = {(r["version"], r["jobs"]): r for r in baseline["results"]}
+    for result in results:
+        base = base_dic.get((result["version"], result["jobs"]))
+        if base is None:
+            continue
+        for metric in gate_metric_list:
+            if result[metric] < base[metric] * (1 - tolerance):
+                regressions.append("{} {} (jobs {}): {} -> {}".format(metric, result["version"], result["jobs"],
+                                                                       base[metric], result[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark report.py on synthetic SDS logs.")
+    parser.add_argument("-n", "--items", type=int, default=50000, help="number of items per log (default: 50000)")
+    parser.add_argument("--threads", type=int, default=8, help="number of worker threads (default: 8)")
+    parser.add_argument("--ftd-fanout", type=float, default=2,
+                        help="mean number of included files checked by FTD per item (default: 2)")
+    parser.add_argument("--block-ratio", type=float, default=0.1, help="ratio of blocked items (default: 0.1)")
+    parser.add_argument("--noise-ratio", type=float, default=5,
+                        help="noise lines per item line (default: 5)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed (default: 1)")
+    parser.add_argument("-j", "--jobs", type=int, nargs="+", default=[1],
+                        help="numbers of worker processes to benchmark (default: 1)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs of each case, the fastest one is reported (default: 3)")
+    parser.add_argument("--work-dir", help="directory for the generated logs (default: a temporary directory)")
+    parser.add_argument("--no-micro", action="store_true",
+                        help="skip the microbenchmarks of the time parser and the marker prefilter")
+    parser.add_argument("--save", help="save the results to this json file as a baseline")
+    parser.add_argument("--baseline", help="json file saved with --save to compare the results with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed throughput drop from the baseline before failing (default: 0.2)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = args.work_dir or temp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        results = []
+        micro_results = []
+        context = multiprocessing.get_context("spawn")
+        for version in bench_version_list:
+            log = os.path.join(work_dir, "bench_{}_{}.log".format(version, args.items))
+            if not os.path.exists(log):
+                print("Generating {} ...".format(log), file=sys.stderr)
+                write_log(log, args, version)
+            for jobs in args.jobs:
+                runs = []
+                for _ in range(args.repeat):
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        runs.append(executor.submit(run_case, log, version, jobs,
+                                                    os.path.join(temp_dir, "report.csv")).result())
+                result = min(runs, key=lambda r: r["total_sec"])
+                results.append(result)
+                print("{version} jobs={jobs}: {lines} lines, {items} items, parse {parse_sec}s, "
+                      "join {join_sec}s, write {write_sec}s, total {total_sec}s, {lines_per_sec} lines/s, "
+                      "{items_per_sec} items/s, peak RSS {peak_rss_mb} MB".format(**result))
+            if not args.no_micro:
+                micro = run_micro(log, version, args.repeat)
+                micro_results.append(micro)
+                print("{version} micro: {times} times, strptime {strptime_sec}s, parse_time {parse_time_sec}s "
+                      "({parse_time_speedup}x); {lines} lines, every pattern {all_regex_sec}s, "
+                      "prefilter lines {prefilter_sec}s ({prefilter_speedup}x), "
+                      "prefilter bytes {prefilter_bytes_sec}s ({prefilter_bytes_speedup}x)".format(**micro))
+
+    params = {"items": args.items, "threads": args.threads, "ftd_fanout": args.ftd_fanout,
+              "block_ratio": args.block_ratio, "noise_ratio": args.noise_ratio, "seed": args.seed}
+    if args.save:
+        with open(args.save, 'w', encoding='utf_8') as f:
+            json.dump({"params": params, "results": results, "micro": micro_results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf_8') as f:
+            baseline = json.load(f)
+        if baseline["params"] != params:
+            print("The baseline was made with other parameters: {}".format(baseline["params"]), file=sys.stderr)
+            exit(2)
+        regressions = compare_results(results, baseline, args.tolerance)
+        for message in regressions:
+            print("Regression: {}".format(message))
+        if regressions:
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+cache of the parse result of each log, keyed by a fingerprint of the log
+"""
+import os
+import hashlib
+import pickle
+
+
+# layout version of the parse cache, change it when the cached fragments change
+cache_format = 5
+
+
+def get_cache_path(cache_dir, log, version):
+    """
+    make the cache file path of a log from its fingerprint
+    so a changed log never hits an old entry (which is evicted later)
+    :param cache_dir: cache directory
+    :param log: log file path
+    :param version: SDS version string
+    """
+    return os.path.join(cache_dir, get_fingerprint(log, version) + ".pickle")
+
+
+def get_fingerprint(log, version, window=None):
+    """
+    hash the path, size, mtime and the head and the tail of a log with the parse options
+    :param log: log file path
+    :param version: SDS version string
+    :param window: time window the log is parsed for, None for the whole log
+    :return: hex digest
+    """
+    st = os.stat(log)
+    h = hashlib.sha1()
+    h.update(repr((cache_format, version, os.path.abspath(log), st.st_size, st.st_mtime_ns, window)).encode())
+    with open(log, "rb") as f:
+        h.update(f.read(65536))
+        if st.st_size > 65536:
+            f.seek(max(65536, st.st_size - 65536))
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def save_cache(cache_path, fragment):
+    """
+    store the fragment of a log
+    :param cache_path: result of get_cache_path
+    :param fragment: sparse (report_dic, sanitization_done_dic, ftd_dic) of the whole log
+    """
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path + ".tmp", "wb") as f:
+        pickle.dump(fragment, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(cache_path + ".tmp", cache_path)
+
+
+def evict_cache(cache_dir, cache_size):
+    """
+    delete the least recently used entries until the cache is not larger than cache_size
+    :param cache_dir: cache directory
+    :param cache_size: max total size in bytes
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        st = os.stat(os.path.join(cache_dir, name))
+        entries.append((st.st_mtime, st.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= cache_size:
+            break
+        os.remove(os.path.join(cache_dir, name))
+        total -= size
@@ -0,0 +1,384 @@
+"""
+command line of report.py and python -m sdsreport
+"""
+import os
+import sys
+import csv
+import glob
+import argparse
+import time
+import pickle
+import random
+from datetime import datetime
+# cProfile is imported where it is used
+
+from . import parse
+from .parse import log_marker_dic, detect_version, get_versions, VersionNotFoundError
+from .cache import get_fingerprint
+from .report import make_window, read_window, report_fields, make_report_rows, write_report
+from .stream import new_stream_state, stream_report_rows, stream_logs, read_new_lines
+from .summary import summary_metrics, summarize_rows, merge_summary, write_summary
+from .timeline import add_timeline, write_timeline
+from .db import open_db, get_loaded_fingerprints, read_db_logs, write_db
+from .compare import compare_fields, collect_compare, compare_groups, read_compare_rows
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak memory is not reported there
+    resource = None
+
+
+def get_peak_rss():
+    """
+    peak resident set size of this process or of its worker processes, whichever is larger, in MB
+    :return: MB or None if unknown
+    """
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # bytes on macOS, kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def print_stats(phase_times):
+    """
+    print the counters of --stats to stderr
+    :param phase_times: [(phase name, seconds), ...]
+    """
+    out = sys.stderr
+    parse_stats = parse.parse_stats
+    print("Phases:", file=out)
+    for phase, seconds in phase_times:
+        print("  {:<16}{:>10.3f} s".format(phase, seconds), file=out)
+    print("Files:", file=out)
+    for log, size, lines, seconds in parse_stats["files"]:
+        print("  {}: {:,} bytes, {:,} lines, {:.3f} s, {:,.0f} lines/s".format(
+            log, size, lines, seconds, lines / seconds if seconds else 0), file=out)
+    print("Patterns: (marker lines, matches, match seconds)", file=out)
+    matched = 0
+    marker_lines = 0
+    for regex, (candidates, hits, seconds) in parse_stats["regex"].items():
+        print("  {:<32}{:>12,}{:>12,}{:>10.3f}".format(log_marker_dic[regex], candidates, hits, seconds), file=out)
+        matched += hits
+        marker_lines += candidates
+    print("Unmatched lines: {:,} ({:,} of them with a marker)".format(
+        parse_stats["lines"] - matched, marker_lines - matched), file=out)
+    print("Orphan events: {:,} SanitizationDone, {:,} FTD".format(
+        parse_stats["orphan_sanitization_done"], parse_stats["orphan_ftd"]), file=out)
+    peak = get_peak_rss()
+    print("Peak memory: {}".format("unknown" if peak is None else "{} MB".format(peak)), file=out)
+
+
+def print_progress(log):
+    """
+    progress of read_logs and stream_logs
+    """
+    print("Starting to process {} ...".format(log), file=sys.stderr)
+
+
+def follow_report(pattern, log_name, version, grace, interval, checkpoint, buffer_size, max_open=None):
+    """
+    keep appending the rows of complete items to the report csv as the logs grow, until interrupted
+    the read offsets and the in-flight state are saved to the checkpoint after every poll,
+    so a restart resumes where it stopped (rows written after the last checkpoint may be repeated)
+    :param pattern: glob pattern of log files, checked again on every poll to find new logs
+    :param log_name: output csv path
+    :param version: SDS version string to use for every log, None to detect it for each log
+    :param grace: seconds to wait for late lines after the status line
+    :param interval: seconds between polls
+    :param checkpoint: checkpoint file path
+    :param buffer_size: write buffer size in bytes
+    :param max_open: seconds after the last line of an item to emit it incomplete, None to keep it until it completes
+    """
+    if os.path.exists(checkpoint):
+        with open(checkpoint, "rb") as f:
+            offsets, versions, state = pickle.load(f)
+        print("Resuming from {} ...".format(checkpoint), file=sys.stderr)
+    else:
+        offsets, versions, state = {}, {}, new_stream_state()
+
+    with open(log_name, 'a', encoding='utf_8_sig', buffering=buffer_size) as f:
+        writer = csv.DictWriter(f, fieldnames=report_fields, lineterminator='\n')
+        if f.tell() == 0:
+            writer.writeheader()
+        try:
+            while True:
+                logs = []
+                for log in glob.glob(pattern):
+                    try:
+                        logs.append((os.path.getmtime(log), log))
+                    except FileNotFoundError:
+                        pass
+                # older (rotated) logs first to keep the time order
+                for _, log in sorted(logs):
+                    try:
+                        st = os.stat(log)
+                    except FileNotFoundError:
+                        continue
+                    identity = (st.st_dev, st.st_ino)
+                    if st.st_size < offsets.get(identity, 0):
+                        print("{} was truncated, reading from the start ...".format(log), file=sys.stderr)
+                    if identity not in versions:
+                        # a new log without an FTD line yet takes the version of the last log
+                        log_version = version or detect_version(log) or \
+                            next(reversed(versions.values()), None)
+                        if not log_version:
+                            print("SDS version is not found in {} yet".format(log), file=sys.stderr)
+                            continue
+                        versions[identity] = log_version
+                    for log_version, lines in read_new_lines(log, offsets, versions[identity]):
+                        writer.writerows(stream_report_rows(lines, log_version, grace, state,
+                                                            finish_all=False, max_open=max_open))
+                f.flush()
+
+                # forget the logs which were deleted
+                identities = set()
+                for _, log in logs:
+                    try:
+                        st = os.stat(log)
+                        identities.add((st.st_dev, st.st_ino))
+                    except FileNotFoundError:
+                        pass
+                for identity in set(offsets) - identities:
+                    del offsets[identity]
+                for identity in set(versions) - identities:
+                    del versions[identity]
+
+                with open(checkpoint + ".tmp", "wb") as cf:
+                    pickle.dump((offsets, versions, state), cf)
+                os.replace(checkpoint + ".tmp", checkpoint)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("Stopped following, state is saved in {}".format(checkpoint), file=sys.stderr)
+
+
+def compare_main(argv):
+    parser = argparse.ArgumentParser(prog="report.py compare",
+                                     description="Compare the latency, block rate and included files of two runs "
+                                                 "of SDS, e.g. before and after an upgrade.")
+    parser.add_argument("a", help="run A (baseline): report csv, or glob pattern of log files")
+    parser.add_argument("b", help="run B: report csv, or glob pattern of log files")
+    parser.add_argument("-o", "--output", default="compare.csv", help="output csv (default: compare.csv)")
+    parser.add_argument("--version", dest="sds_version",
+                        help="SDS version of the logs instead of detecting it from each log")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes to parse logs with (default: 1)")
+    parser.add_argument("--bootstrap", type=int, default=1000,
+                        help="bootstrap resamples for the percentile intervals (default: 1000)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the bootstrap (default: 0)")
+    parser.add_argument("--gate", type=float,
+                        help="exit with 1 when a duration percentile got significantly slower by more than this "
+                             "percent")
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(args.seed)
+    try:
+        groups_a = collect_compare(read_compare_rows(args.a, args.sds_version, args.jobs, print_progress))
+        groups_b = collect_compare(read_compare_rows(args.b, args.sds_version, args.jobs, print_progress))
+    except VersionNotFoundError as e:
+        print("{}, specify it with --version".format(e))
+        exit(1)
+
+    regressions = []
+    with open(args.output, 'w', encoding='utf_8_sig') as f:
+        writer = csv.DictWriter(f, fieldnames=compare_fields, lineterminator='\n')
+        writer.writeheader()
+        for row in compare_groups(groups_a, groups_b, args.bootstrap, rnd):
+            writer.writerow(row)
+            if row["Significant"]:
+                print("{Group}: {Metric} {Statistic} {A} -> {B} ({Delta:+}, CI {CILow:+} .. {CIHigh:+})".format(**row))
+                if args.gate is not None and row["Metric"] in summary_metrics and \
+                        row["CILow"] > 0 and row["Delta"] > row["A"] * args.gate / 100:
+                    regressions.append(row)
+    if regressions:
+        print("{} percentiles got slower by more than {}%".format(len(regressions), args.gate))
+        exit(1)
+
+
+def main():
+    if sys.argv[1:2] == ["compare"]:
+        compare_main(sys.argv[2:])
+        return
+    parser = argparse.ArgumentParser(description="Make a csv report of SDS sanitization latency from logs. "
+                                                 "\"report.py compare A B\" compares two reports or log sets.")
+    parser.add_argument("log", help="glob pattern of log files (e.g. *log*)")
+    parser.add_argument("report", nargs="?", default="report.csv", help="output csv (default: report.csv)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes to parse logs with (default: 1)")
+    parser.add_argument("--stream", action="store_true",
+                        help="write each item as soon as it is complete and keep only in-flight items in memory")
+    parser.add_argument("--grace", type=float, default=5,
+                        help="seconds to wait for late lines of a complete item in --stream mode (default: 5)")
+    parser.add_argument("--max-open", type=float, default=3600,
+                        help="seconds after the last line of an item to write it incomplete in --stream and "
+                             "--follow mode, e.g. when its status line is missing, 0 to wait until the end "
+                             "(default: 3600)")
+    parser.add_argument("--follow", action="store_true",
+                        help="keep reading new lines of the logs like --stream and append rows to the report "
+                             "until interrupted")
+    parser.add_argument("--interval", type=float, default=1,
+                        help="seconds between polls of the logs in --follow mode (default: 1)")
+    parser.add_argument("--checkpoint",
+                        help="checkpoint file of --follow mode to resume from (default: REPORT.checkpoint)")
+    parser.add_argument("--cache-dir", default=os.path.join(os.path.expanduser("~"), ".sdsreport_cache"),
+                        help="directory to cache the parse result of each log in (default: ~/.sdsreport_cache)")
+    parser.add_argument("--cache-size", type=int, default=2048,
+                        help="max total size of the cache in MB (default: 2048)")
+    parser.add_argument("--no-cache", action="store_true", help="parse every log without the cache")
+    parser.add_argument("--version", dest="sds_version",
+                        help="SDS version of the logs (e.g. 7.4) instead of detecting it from each log; "
+                             "the members of a zip archive with an FTD line still use the version in it")
+    parser.add_argument("--buffer-size", type=int, default=1024 * 1024,
+                        help="write buffer size of the report csv in bytes (default: 1048576)")
+    parser.add_argument("--summary",
+                        help="also write the count, mean and p50/p95/p99 of the durations per FileType, Status, "
+                             "BlockReason and time bucket to this csv")
+    parser.add_argument("--time-bucket", type=float, default=5,
+                        help="minutes of a time bucket of RequestReceivedTime in the summary (default: 5)")
+    parser.add_argument("--sketch-file",
+                        help="file to keep the summary sketches in; the sketches already in it are merged into "
+                             "the summary, so runs over different logs can be combined")
+    parser.add_argument("--from", dest="time_from", type=datetime.fromisoformat,
+                        help="report only the items received at or after this time (e.g. \"2021-02-01 10:00\"), "
+                             "seeking to it in the logs")
+    parser.add_argument("--to", dest="time_to", type=datetime.fromisoformat,
+                        help="report only the items received at or before this time, and stop reading the logs "
+                             "after it plus --margin")
+    parser.add_argument("--margin", type=float, default=600,
+                        help="seconds of the logs read after --to for the items received before it to complete "
+                             "(default: 600)")
+    parser.add_argument("--timeline",
+                        help="also write the mean number of items queued, sanitizing, publishing and waiting for "
+                             "download, and the items received and responded, for every second to this csv")
+    parser.add_argument("--db",
+                        help="write the items, SanitizationDone and FTD events to this SQLite database instead of "
+                             "the csv; the logs already written to it are skipped, so it can be run again as "
+                             "logs are added")
+    parser.add_argument("--stats", action="store_true",
+                        help="print the time of each phase, the lines/s of each log, the matches and match time of "
+                             "each pattern, the unmatched lines, the orphan events and the peak memory; "
+                             "every log is parsed without the cache")
+    parser.add_argument("--profile", help="write cProfile data of the run to this file (e.g. for snakeviz or pstats)")
+    args = parser.parse_args()
+    if args.stats and (args.stream or args.follow or args.jobs != 1):
+        parser.error("--stats cannot be combined with --stream, --follow or --jobs")
+    if (args.stream or args.follow) and args.jobs != 1:
+        parser.error("--stream and --follow parse logs in order and cannot be combined with --jobs")
+    if args.follow and (args.summary or args.sketch_file):
+        parser.error("--summary and --sketch-file cannot be combined with --follow")
+    if args.sketch_file and not args.summary:
+        parser.error("--sketch-file needs --summary")
+    if args.db and (args.stream or args.follow or args.summary or args.timeline):
+        parser.error("--db cannot be combined with --stream, --follow, --summary or --timeline")
+    if args.follow and args.timeline:
+        parser.error("--timeline cannot be combined with --follow")
+    if (args.time_from or args.time_to) and (args.stream or args.follow):
+        parser.error("--from and --to cannot be combined with --stream or --follow")
+
+    log_name = args.report
+    log_list = glob.glob(args.log)
+
+    phase_times = []
+    if args.stats:
+        parse.parse_stats = parse.new_parse_stats()
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    # version check
+    phase_start = time.perf_counter()
+    if not args.follow:
+        try:
+            versions = get_versions(log_list, args.sds_version)
+        except VersionNotFoundError as e:
+            print("{}, specify it with --version".format(e))
+            exit(1)
+    phase_times.append(("version check", time.perf_counter() - phase_start))
+
+    # read log and make record
+    start_time = datetime.now()
+    if args.follow:
+        print("Following {} ...".format(args.log))
+        follow_report(args.log, log_name, args.sds_version, args.grace, args.interval,
+                      args.checkpoint or log_name + ".checkpoint", args.buffer_size, args.max_open)
+    else:
+        if args.db:
+            # only the logs which are not in the database yet are parsed
+            db = open_db(args.db)
+            window = make_window(args.time_from, args.time_to, args.margin)[0]
+            fingerprints = {log: get_fingerprint(log, versions[log], window) for log in log_list}
+            loaded = get_loaded_fingerprints(db)
+            print("{} of {} logs are already in {}".format(
+                sum(fingerprints[log] in loaded for log in log_list), len(log_list), args.db), file=sys.stderr)
+            log_list = [log for log in log_list if fingerprints[log] not in loaded]
+
+        cache_dir = None if args.no_cache or args.stats else args.cache_dir
+        if args.stream:
+            rows = stream_logs(log_list, versions, args.grace, args.max_open, print_progress)
+        elif args.db:
+            phase_start = time.perf_counter()
+            db_result = read_db_logs(log_list, versions, args.jobs, cache_dir, args.cache_size * 1024 * 1024,
+                                     args.time_from, args.time_to, args.margin, print_progress)
+            phase_times.append(("parse", time.perf_counter() - phase_start))
+            rows = None
+        else:
+            phase_start = time.perf_counter()
+            report_dic, sanitization_done_dic, ftd_dic = read_window(log_list, versions, args.jobs, cache_dir,
+                                                                      args.cache_size * 1024 * 1024,
+                                                                      args.time_from, args.time_to, args.margin,
+                                                                      print_progress)
+            phase_times.append(("parse", time.perf_counter() - phase_start))
+            rows = make_report_rows(report_dic, sanitization_done_dic, ftd_dic)
+            if args.stats:
+                # join all rows before writing to time the two phases apart
+                phase_start = time.perf_counter()
+                rows = list(rows)
+                phase_times.append(("join", time.perf_counter() - phase_start))
+
+        summary_dic = {}
+        if args.summary:
+            rows = summarize_rows(rows, summary_dic, args.time_bucket)
+        timeline = {}
+        if args.timeline:
+            rows = add_timeline(rows, timeline)
+
+        phase_start = time.perf_counter()
+        if args.db:
+            print("Writing database ...")
+            write_db(db, db_result, [(log, fingerprints[log]) for log in log_list])
+            db.close()
+        else:
+            print("Creating csv file ...")
+            write_report(log_name, rows, args.buffer_size)
+        phase_times.append(("write", time.perf_counter() - phase_start))
+
+        if args.summary:
+            if args.sketch_file:
+                if os.path.exists(args.sketch_file):
+                    with open(args.sketch_file, "rb") as f:
+                        merge_summary(summary_dic, pickle.load(f))
+                with open(args.sketch_file + ".tmp", "wb") as f:
+                    pickle.dump(summary_dic, f)
+                os.replace(args.sketch_file + ".tmp", args.sketch_file)
+            print("Creating summary csv file ...")
+            write_summary(args.summary, summary_dic)
+        if args.timeline:
+            print("Creating timeline csv file ...")
+            write_timeline(args.timeline, timeline)
+
+    end_time = datetime.now()
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+    if args.stats:
+        print_stats(phase_times)
+
+    # how many hours take
+    print("Start: {0}".format(start_time.strftime("%Y/%m/%d %H:%M:%S")))
+    print("End: {0}".format(end_time.strftime("%Y/%m/%d %H:%M:%S")))
+    print("Total: {0}".format(end_time - start_time))
@@ -0,0 +1,199 @@
+"""
+comparison of two runs, e.g. before and after an SDS upgrade, with bootstrap intervals
+"""
+import csv
+import math
+import statistics
+from bisect import bisect_right
+
+from .report import build_report
+from .summary import summary_metrics, summary_quantiles, LatencySketch
+
+
+# upper bounds of the FileSize buckets which the items of two runs are compared in
+size_bucket_list = [(64 * 1024, "<64KB"), (1024 * 1024, "64KB-1MB"), (16 * 1024 * 1024, "1MB-16MB")]
+
+# confidence level of the intervals in the comparison
+compare_confidence = 0.95
+
+# items above a percentile in both runs needed to call its shift significant
+compare_min_tail = 10
+
+# columns of the compare csv
+compare_fields = ["Group", "Metric", "Statistic", "CountA", "CountB", "A", "B", "Delta", "CILow", "CIHigh",
+                  "Significant"]
+
+
+def get_size_bucket(size):
+    """
+    name the FileSize bucket of an item
+    :param size: FileSize of a row, "" if unknown
+    """
+    if size in ("", None):
+        return "unknown"
+    size = int(size)
+    for bound, name in size_bucket_list:
+        if size < bound:
+            return name
+    return ">=16MB"
+
+
+class CompareGroup:
+    """
+    what one run is compared with: a sketch of each duration, the blocked items
+    and the mean and variance of IncludedFileCount
+    """
+    __slots__ = ("sketches", "blocked", "statuses", "included", "included_mean", "included_m2")
+
+    def __init__(self):
+        self.sketches = {metric: LatencySketch() for metric in summary_metrics}
+        self.blocked = self.statuses = 0
+        self.included = 0
+        self.included_mean = self.included_m2 = 0.0
+
+    def add(self, row):
+        """
+        add a report row
+        :param row: row dictionary with report_fields keys, from make_report_rows or a report csv
+        """
+        for metric in summary_metrics:
+            value = row[metric]
+            if value != "":
+                self.sketches[metric].add(float(value))
+        if row["Status"]:
+            self.statuses += 1
+            self.blocked += row["Status"] == "Blocked"
+        if row["IncludedFileCount"] != "":
+            # Welford's online mean and variance
+            self.included += 1
+            value = int(row["IncludedFileCount"])
+            delta = value - self.included_mean
+            self.included_mean += delta / self.included
+            self.included_m2 += delta * (value - self.included_mean)
+
+
+def collect_compare(rows):
+    """
+    sort the rows of one run into their comparison groups, all items and each FileType and FileSize bucket
+    :param rows: iterable of row dictionaries
+    :return: {(FileType, size bucket): CompareGroup}
+    """
+    groups = {}
+    for row in rows:
+        for key in (("All", ""), (row["FileType"] or "unknown", get_size_bucket(row["FileSize"]))):
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = CompareGroup()
+            group.add(row)
+    return groups
+
+
+def bootstrap_quantile(table, count, q, rnd):
+    """
+    draw the q quantile of a bootstrap resample of all the values in a sketch
+    the k-th smallest of n values drawn with replacement is the value at rank floor(n * Beta(k, n - k + 1)),
+    so a resample costs one draw instead of n
+    :param table: rank_table of the sketch
+    :param count: number of values in the sketch
+    :param q: 0 to 1
+    :param rnd: random.Random
+    """
+    k = int(q * (count - 1)) + 1
+    if min(k, count - k + 1) >= 30:
+        # the beta distribution is close to normal here, and gauss is much faster than betavariate
+        a, b = k, count - k + 1
+        u = rnd.gauss(a / (a + b), math.sqrt(a * b / ((a + b) ** 2 * (a + b + 1))))
+    else:
+        u = rnd.betavariate(k, count - k + 1)
+    rank = min(max(int(u * count), 0), count - 1)
+    return table[1][bisect_right(table[0], rank)]
+
+
+def bootstrap_quantile_deltas(sketch_a, sketch_b, rounds, rnd):
+    """
+    bootstrap the confidence intervals of the differences of summary_quantiles between two runs
+    :param sketch_a: LatencySketch of run A
+    :param sketch_b: LatencySketch of run B
+    :param rounds: number of resamples
+    :param rnd: random.Random
+    :return: list of (low, high) in the order of summary_quantiles
+    """
+    table_a, table_b = sketch_a.rank_table(), sketch_b.rank_table()
+    deltas = [[] for _ in summary_quantiles]
+    for _ in range(rounds):
+        for i, (_, q) in enumerate(summary_quantiles):
+            deltas[i].append(bootstrap_quantile(table_b, sketch_b.count, q, rnd) -
+                             bootstrap_quantile(table_a, sketch_a.count, q, rnd))
+    tail = (1 - compare_confidence) / 2
+    intervals = []
+    for values in deltas:
+        values.sort()
+        intervals.append((values[int(tail * (rounds - 1))], values[int((1 - tail) * (rounds - 1))]))
+    return intervals
+
+
+def compare_groups(groups_a, groups_b, rounds, rnd):
+    """
+    yield the compare csv rows of the groups found in both runs
+    :param groups_a: result of collect_compare for run A
+    :param groups_b: result of collect_compare for run B
+    :param rounds: number of bootstrap resamples
+    :param rnd: random.Random
+    """
+    z = statistics.NormalDist().inv_cdf(1 - (1 - compare_confidence) / 2)
+    for key in sorted(set(groups_a) & set(groups_b), key=lambda k: (k != ("All", ""), k)):
+        a, b = groups_a[key], groups_b[key]
+        name = "All" if key == ("All", "") else "{} {}".format(*key)
+
+        # percentiles of the durations
+        for metric in summary_metrics:
+            sketch_a, sketch_b = a.sketches[metric], b.sketches[metric]
+            if not sketch_a.count or not sketch_b.count:
+                continue
+            intervals = bootstrap_quantile_deltas(sketch_a, sketch_b, rounds, rnd)
+            for (statistic, q), (low, high) in zip(summary_quantiles, intervals):
+                value_a, value_b = sketch_a.quantile(q), sketch_b.quantile(q)
+                # a percentile with only a few items above it is too noisy to call a shift
+                enough = min(sketch_a.count, sketch_b.count) * (1 - q) >= compare_min_tail
+                yield {"Group": name, "Metric": metric, "Statistic": statistic, "CountA": sketch_a.count,
+                       "CountB": sketch_b.count, "A": round(value_a, 3), "B": round(value_b, 3),
+                       "Delta": round(value_b - value_a, 3), "CILow": round(low, 3), "CIHigh": round(high, 3),
+                       "Significant": enough and (low > 0 or high < 0)}
+
+        # block rate, normal approximation of the difference of two proportions
+        if a.statuses and b.statuses:
+            rate_a, rate_b = a.blocked / a.statuses, b.blocked / b.statuses
+            se = math.sqrt(rate_a * (1 - rate_a) / a.statuses + rate_b * (1 - rate_b) / b.statuses)
+            delta = rate_b - rate_a
+            yield {"Group": name, "Metric": "Status", "Statistic": "BlockRate", "CountA": a.statuses,
+                   "CountB": b.statuses, "A": round(rate_a, 4), "B": round(rate_b, 4), "Delta": round(delta, 4),
+                   "CILow": round(delta - z * se, 4), "CIHigh": round(delta + z * se, 4),
+                   "Significant": abs(delta) > z * se}
+
+        # mean of the included files, normal approximation of the difference of two means
+        if a.included > 1 and b.included > 1:
+            se = math.sqrt(a.included_m2 / (a.included - 1) / a.included +
+                           b.included_m2 / (b.included - 1) / b.included)
+            delta = b.included_mean - a.included_mean
+            yield {"Group": name, "Metric": "IncludedFileCount", "Statistic": "Mean", "CountA": a.included,
+                   "CountB": b.included, "A": round(a.included_mean, 3), "B": round(b.included_mean, 3),
+                   "Delta": round(delta, 3), "CILow": round(delta - z * se, 3), "CIHigh": round(delta + z * se, 3),
+                   "Significant": abs(delta) > z * se}
+
+
+def read_compare_rows(source, version=None, jobs=1, progress=None):
+    """
+    read the rows of one run from a report csv, or make them from a log set
+    :param source: report csv path (*.csv), or glob pattern of log files
+    :param version: SDS version of the logs, None to detect it from each log
+    :param jobs: number of worker processes to parse logs with
+    :param progress: function called with each log before it is read, None for none
+    """
+    if source.lower().endswith(".csv"):
+        with open(source, encoding='utf_8_sig', newline='') as f:
+            # the csv of the older report.py has "ItemID, FileName, ..." with a space after each comma
+            reader = csv.DictReader(f, skipinitialspace=True)
+            reader.fieldnames = [name.strip() for name in reader.fieldnames or []]
+            yield from reader
+    else:
+        yield from build_report(source, version, jobs, progress=progress)
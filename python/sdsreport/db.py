@@ -0,0 +1,181 @@
+"""
+SQLite database of the items and the thread events, appended to incrementally
+"""
+import os
+import hashlib
+from datetime import datetime
+# sqlite3 is imported where it is used
+
+from .parse import (version_scan_size, regex_line_time, parse_report_time, format_time, Record, open_log,
+                    merge_fragment)
+from .report import read_fragments, make_window, filter_received, report_fields, make_report_rows
+
+
+# tables of the --db database, items has ThreadID and the columns of the report csv
+db_schema = """
+CREATE TABLE IF NOT EXISTS items (
+    ItemID TEXT PRIMARY KEY, ThreadID TEXT, FileName TEXT, FileSize INTEGER, FileType TEXT,
+    RequestReceivedTime TEXT, SanitizationStartedTime TEXT, SanitizationDoneTime TEXT, PublishDoneTime TEXT,
+    ResponseDoneTime TEXT, TotalProcessSeconds REAL, UploadAndQueueWaitSeconds REAL, PublishProcessSeconds REAL,
+    DownloadWaitSeconds REAL, PublishFileName TEXT, IncludedFileCount INTEGER, Status TEXT, BlockReason TEXT);
+CREATE INDEX IF NOT EXISTS items_thread ON items (ThreadID, SanitizationStartedTime);
+CREATE INDEX IF NOT EXISTS items_received ON items (RequestReceivedTime);
+CREATE INDEX IF NOT EXISTS items_status ON items (Status, FileType);
+CREATE TABLE IF NOT EXISTS sanitization_done (
+    LogID TEXT, Position INTEGER, ThreadID TEXT, Time TEXT, FileName TEXT, PRIMARY KEY (LogID, Position));
+CREATE INDEX IF NOT EXISTS sanitization_done_thread ON sanitization_done (ThreadID, Time);
+CREATE TABLE IF NOT EXISTS ftd (
+    LogID TEXT, Position INTEGER, ThreadID TEXT, Time TEXT, IncludedFile TEXT, PRIMARY KEY (LogID, Position));
+CREATE INDEX IF NOT EXISTS ftd_thread ON ftd (ThreadID, Time);
+CREATE TABLE IF NOT EXISTS logs (
+    Fingerprint TEXT PRIMARY KEY, Path TEXT, Size INTEGER, LoadedTime TEXT);
+"""
+
+# max number of variables in a statement of old SQLite builds
+db_max_variables = 999
+
+
+def get_log_id(log):
+    """
+    identify a log by its first line with a time, which stays the same when the log grows or is renamed (rotated),
+    unlike get_fingerprint
+    :param log: log file path
+    :return: hex digest, None if there is no line with a time within the first version_scan_size characters
+    """
+    scanned = 0
+    with open_log(log) as f:
+        for line in f:
+            if regex_line_time.match(line[:64].encode()):
+                return hashlib.sha1(line.encode()).hexdigest()
+            scanned += len(line)
+            if scanned >= version_scan_size:
+                break
+    return None
+
+
+def open_db(db_name):
+    """
+    open the --db database in WAL mode, creating the tables and indexes
+    :param db_name: database file path
+    :return: sqlite3.Connection
+    """
+    import sqlite3
+    db = sqlite3.connect(db_name)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(db_schema)
+    return db
+
+
+def get_loaded_fingerprints(db):
+    """
+    fingerprints of the logs already written to the database
+    """
+    return {fingerprint for fingerprint, in db.execute("SELECT Fingerprint FROM logs")}
+
+
+def load_db_records(db, item_ids):
+    """
+    read the stored items back as Records
+    :param db: sqlite3.Connection
+    :param item_ids: list of item ids
+    :return: {item_id: Record} of the items found
+    """
+    records = {}
+    for i in range(0, len(item_ids), db_max_variables):
+        chunk = item_ids[i:i + db_max_variables]
+        for row in db.execute("SELECT ItemID, ThreadID, FileName, FileSize, FileType, RequestReceivedTime, "
+                              "SanitizationStartedTime, PublishDoneTime, ResponseDoneTime, PublishFileName, Status, "
+                              "BlockReason FROM items WHERE ItemID IN ({})".format(",".join("?" * len(chunk))),
+                              chunk):
+            record = Record()
+            (record.ThreadID, record.FileName, record.FileSize, record.FileType, received, started, published,
+             responded, record.PublishFileName, record.Status, record.BlockReason) = row[1:]
+            if record.FileSize is not None:
+                record.FileSize = str(record.FileSize)
+            record.RequestReceivedTime = parse_report_time(received)
+            record.SanitizationStartedTime = parse_report_time(started)
+            record.PublishDoneTime = parse_report_time(published)
+            record.ResponseDoneTime = parse_report_time(responded)
+            records[row[0]] = record
+    return records
+
+
+def load_db_events(db, table, time_ranges):
+    """
+    read the stored events of each thread within a time range
+    :param db: sqlite3.Connection
+    :param table: "sanitization_done" or "ftd"
+    :param time_ranges: {thread_id: (start time, end time)}
+    :return: {thread_id: [(time, file name), ...]} in the order they were stored
+    """
+    event_dic = {}
+    for thread_id, (start, end) in time_ranges.items():
+        event_dic[thread_id] = [(parse_report_time(t), name) for t, name in db.execute(
+            "SELECT Time, {} FROM {} WHERE ThreadID = ? AND Time >= ? AND Time <= ? ORDER BY rowid".format(
+                "FileName" if table == "sanitization_done" else "IncludedFile", table),
+            (thread_id, format_time(start), format_time(end)))]
+    return event_dic
+
+
+def read_db_logs(log_list, versions, jobs, cache_dir=None, cache_size=0, time_from=None, time_to=None, margin=600,
+                 progress=None):
+    """
+    read_window which keeps the events of each log apart, as write_db stores them by log and line position
+    :return: (report_dic, [(log id, sanitization_done_dic, ftd_dic), ...] in log order)
+    """
+    window, received = make_window(time_from, time_to, margin)
+    report_dic, log_events = {}, []
+    for log, fragment in read_fragments(log_list, versions, jobs, cache_dir, cache_size, window, progress):
+        merge_fragment((report_dic, {}, {}), (fragment[0], {}, {}))
+        log_events.append((get_log_id(log), fragment[1], fragment[2]))
+    return filter_received(report_dic, received), log_events
+
+
+def write_db(db, result, loaded_logs):
+    """
+    add the parse result of new logs to the database in one transaction
+    the items also found in earlier logs are merged with their stored fields and joined again with
+    the stored events, so a log can be added after the logs before it
+    events are unique by the log (get_log_id) and the position of their line, so writing the same lines twice
+    adds nothing, also after the log grew or was renamed, while separate events with the same contents are kept
+    :param db: sqlite3.Connection
+    :param result: result of read_db_logs for the new logs
+    :param loaded_logs: [(log, fingerprint), ...] of the new logs
+    """
+    report_dic, log_events = result
+    with db:
+        for log_id, sanitization_done_dic, ftd_dic in log_events:
+            db.executemany("INSERT OR IGNORE INTO sanitization_done VALUES (?, ?, ?, ?, ?)",
+                           ((log_id, pos, thread_id, format_time(t), name)
+                            for thread_id, entries in sanitization_done_dic.items() for t, name, pos in entries))
+            db.executemany("INSERT OR IGNORE INTO ftd VALUES (?, ?, ?, ?, ?)",
+                           ((log_id, pos, thread_id, format_time(t), name)
+                            for thread_id, entries in ftd_dic.items() for t, name, pos in entries))
+
+        # the new lines come later in the log than the stored ones
+        records = load_db_records(db, list(report_dic))
+        for item_id, record in report_dic.items():
+            if item_id in records:
+                records[item_id].update(record)
+            else:
+                records[item_id] = record
+
+        # the events each item can be joined with, which may have been stored by an earlier run
+        time_ranges = {}
+        for record in records.values():
+            started, published = record.SanitizationStartedTime, record.PublishDoneTime
+            if record.ThreadID is None or started is None or published is None:
+                continue
+            start, end = time_ranges.get(record.ThreadID, (started, published))
+            time_ranges[record.ThreadID] = (min(start, started), max(end, published))
+        rows = make_report_rows(records, load_db_events(db, "sanitization_done", time_ranges),
+                                load_db_events(db, "ftd", time_ranges))
+        db.executemany("INSERT OR REPLACE INTO items VALUES ({})".format(",".join("?" * (len(report_fields) + 1))),
+                       ((row["ItemID"], records[row["ItemID"]].ThreadID) +
+                        tuple(None if row[name] == "" else row[name] for name in report_fields[1:])
+                        for row in rows))
+        now = str(datetime.now())
+        db.executemany("INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?)",
+                       ((fingerprint, os.path.abspath(log), os.path.getsize(log), now)
+                        for log, fingerprint in loaded_logs))
@@ -0,0 +1,149 @@
+import sys
+import argparse
+import heapq
+import random
+from datetime import datetime, timedelta
+
+
+# items on the same worker thread are sanitized one after another, request and status lines come from these threads
+request_threads = ["3-{}".format(i) for i in range(1, 5)]
+status_threads = ["5-{}".format(i) for i in range(1, 5)]
+
+file_type_list = [("pdf", "Pdf"), ("docx", "Word"), ("xlsx", "Excel"), ("pptx", "PowerPoint"), ("zip", "Zip"),
+                  ("jpg", "Image")]
+
+block_reason_list = [("Policy", "[Macro found]"), ("Policy", "[Embedded object found]"),
+                     ("Password", "[Password protected file]"), ("Malware", "[Detected by AV engine]")]
+
+noise_line_list = ["4 Debug | Connection pool status: active={}, idle={}",
+                   "3 Debug | Heartbeat from engine {} took {} ms",
+                   "2 Info | Config reloaded: {} keys, {} changed",
+                   "4 Debug | Queue length: {}, workers busy: {}"]
+
+
+def format_log_time(t):
+    """
+    format a datetime like the SDS log does (dd/mm/yyyy hh:mm:ss.fff)
+    """
+    return t.strftime("%d/%m/%Y %H:%M:%S.") + "{:03d}".format(t.microsecond // 1000)
+
+
+def make_item_lines(rnd, index, received, started, worker, version, ftd_fanout, block_ratio):
+    """
+    make the (time, line) pairs of one item, each pattern of report.log_pattern_dic once (FTD lines many times)
+    :return: list of (datetime, line) and the time the worker is free again
+    """
+    item_id = "{:08x}-{:04x}-{:04x}".format(rnd.getrandbits(32), index & 0xffff, rnd.getrandbits(16))
+    extension, file_type = rnd.choice(file_type_list)
+    file_name = "file{}.{}".format(index, extension)
+    lines = [(received, "{} | {} | 2 Info | Sanitization Request Received: Request ID: {}, Source: "
+                        "C:\\SDS\\Upload\\{}\\{}, Size: {}, Priority: Normal".format(
+                            rnd.choice(request_threads), format_log_time(received), item_id, index, file_name,
+                            rnd.randint(1, 50 * 1024 * 1024)))]
+    lines.append((started, "{} | {} | 2 Info | Sanitization Started: Item ID: {}, Filename: {}, Size: {}".format(
+        worker, format_log_time(started), item_id, file_name, rnd.randint(1, 50 * 1024 * 1024))))
+
+    # the item itself and its included files are checked by FTD
+    t = started
+    for k in range(1 + (int(rnd.expovariate(1 / ftd_fanout)) if ftd_fanout > 0 else 0)):
+        t += timedelta(milliseconds=rnd.randint(1, 30))
+        included = file_name if k == 0 else "inner{}.{}".format(k, rnd.choice(file_type_list)[0])
+        lines.append((t, "{} | {} | 2 Info | FTD result for C:\\SDS\\Work\\{}\\{} is #Library version: {}.0.1234".format(
+            worker, format_log_time(t), index, included, version)))
+
+    t += timedelta(milliseconds=int(rnd.lognormvariate(5, 1)))
+    lines.append((t, "{} | {} | 2 Info | [10020110] Sanitization Done (File {} sanitization process successfully "
+                     "ended.)".format(worker, format_log_time(t), file_name)))
+    blocked = rnd.random() < block_ratio
+    if blocked:
+        reason, details = rnd.choice(block_reason_list)
+        lines.append((t, "{} | {} | 2 Info | Item Blocked. Item ID: {}, Filename: {}, Type: {}, Reason: {}, "
+                         "Details: {}".format(worker, format_log_time(t), item_id, file_name, file_type, reason,
+                                              details)))
+    t += timedelta(milliseconds=rnd.randint(1, 20))
+    lines.append((t, "{} | {} | 2 Info | Publish Done: Items: {{ Item ID: {}, Filename: {}, Type: {} }}".format(
+        worker, format_log_time(t), item_id, file_name, file_type)))
+    free = t
+
+    # the client polls the status a while after the publish
+    t += timedelta(milliseconds=int(rnd.lognormvariate(6, 1)))
+    status = "Blocked" if blocked else "Done"
+    if float(version[0:3]) >= 7.4:
+        status_line = "GetStatus was called for ID:{}. Status:{}".format(item_id, status)
+    else:
+        status_line = "{}'s Status = {}".format(item_id, status)
+    lines.append((t, "{} | {} | 2 Info | {}".format(rnd.choice(status_threads), format_log_time(t), status_line)))
+    return lines, free
+
+
+def generate_lines(items, threads, version, ftd_fanout, block_ratio, noise_ratio, seed=1,
+                   start=datetime(2021, 2, 1, 9, 0, 0)):
+    """
+    yield the lines of a synthetic SDS log in time order
+    items arrive at random and wait for the first free worker thread, so items of different threads interleave
+    :param items: number of items
+    :param threads: number of worker threads
+    :param version: SDS version string (e.g. 7.4 or 7.3), which decides the format of the status lines
+    :param ftd_fanout: mean number of included files checked by FTD per item
+    :param block_ratio: ratio of blocked items
+    :param noise_ratio: noise lines per item line
+    :param seed: random seed, the same arguments make the same log
+    :param start: time of the first line
+    """
+    rnd = random.Random(seed)
+    workers = [(start, "12-{}".format(i)) for i in range(1, threads + 1)]
+    heapq.heapify(workers)
+    pending = []    # heap of (time, serial, line)
+    serial = 0
+    received = start
+    for index in range(items):
+        received += timedelta(milliseconds=int(rnd.expovariate(threads / 500)) + 1)
+        # the lines before this arrival can't be preceded by a later item any more
+        while pending and pending[0][0] < received:
+            yield heapq.heappop(pending)[2]
+        free, worker = heapq.heappop(workers)
+        started = max(received, free) + timedelta(milliseconds=rnd.randint(1, 50))
+        lines, free = make_item_lines(rnd, index, received, started, worker, version, ftd_fanout, block_ratio)
+        heapq.heappush(workers, (free, worker))
+        for t, line in lines:
+            noise = int(noise_ratio) + (rnd.random() < noise_ratio - int(noise_ratio))
+            for _ in range(noise):
+                heapq.heappush(pending, (t, serial, "{} | {} | {}".format(
+                    rnd.choice(request_threads + [worker]), format_log_time(t),
+                    rnd.choice(noise_line_list).format(rnd.randint(0, 99), rnd.randint(0, 999)))))
+                serial += 1
+            heapq.heappush(pending, (t, serial, line))
+            serial += 1
+    while pending:
+        yield heapq.heappop(pending)[2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic SDS log for testing and benchmarking report.py.")
+    parser.add_argument("log", help="output log file, - for stdout")
+    parser.add_argument("-n", "--items", type=int, default=10000, help="number of items (default: 10000)")
+    parser.add_argument("--threads", type=int, default=8, help="number of worker threads (default: 8)")
+    parser.add_argument("--version", dest="sds_version", default="7.4",
+                        help="SDS version, 7.3 or older writes the pre-7.4 status lines (default: 7.4)")
+    parser.add_argument("--ftd-fanout", type=float, default=2,
+                        help="mean number of included files checked by FTD per item (default: 2)")
+    parser.add_argument("--block-ratio", type=float, default=0.1, help="ratio of blocked items (default: 0.1)")
+    parser.add_argument("--noise-ratio", type=float, default=5,
+                        help="noise lines per item line, which match no pattern (default: 5)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed (default: 1)")
+    args = parser.parse_args()
+
+    lines = generate_lines(args.items, args.threads, args.sds_version, args.ftd_fanout, args.block_ratio,
+                           args.noise_ratio, args.seed)
+    f = sys.stdout if args.log == "-" else open(args.log, 'w', encoding='utf_8', buffering=1024 * 1024)
+    try:
+        for line in lines:
+            f.write(line)
+            f.write("\n")
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,799 @@
+"""
+parsing of SDS logs into records and thread events, reading plain logs through mmap and compressed logs as streams
+"""
+import os
+import io
+import mmap
+import codecs
+import re
+import time
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+# gzip, bz2, lzma, zipfile and concurrent.futures are imported where they are used,
+# so importing this module as a library stays cheap
+
+
+# byte size of a chunk which a worker parses at once in --jobs mode
+chunk_size = 64 * 1024 * 1024
+
+# characters of the head of a log to look for the SDS version in
+version_scan_size = 16 * 1024 * 1024
+
+# ms before --from to start reading at, as the threads write their lines slightly out of time order
+window_slack = 60 * 1000
+
+# counters of --stats, None when it is off so the hot path only checks it once per line;
+# the other modules read it as parse.parse_stats, as the command line sets it after they are imported
+parse_stats = None
+
+
+# regular expression pattern
+# ThreadID, Time, ItemID, FileName, FileSize
+regex_pattern_request_received = re.compile(r"(?P<ThreadID>\d+-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}).* \| Sanitization Request Received: Request ID: (?P<ItemID>[^,]+), Source: .*\\(?P<FileName>[^,\\]+), Size: (?P<FileSize>\d+).*")
+# ThreadID, Time, ItemID, FileName
+regex_pattern_sanitization_started = re.compile(r"(?P<ThreadID>\d+-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}).* \| Sanitization Started: Item ID: (?P<ItemID>[^,]+), Filename: (?P<FileName>[^,]+), .*")
+# ThreadID, Time, FileName
+regex_pattern_sanitization_done = re.compile(r"(?P<ThreadID>\d+-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}).*\| \[10020110\] Sanitization Done \(File (?P<FileName>.*?) sanitization process successfully ended\.\)")
+# ThreadID, Time, ItemID, PublishFileName, FileType
+regex_pattern_publish_done = re.compile(r"(?P<ThreadID>\d+-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}) \| 2 Info \| Publish Done: Items: \{ Item ID: (?P<ItemID>[^,]+), Filename: (?P<FileName>[^,]+), Type: (?P<FileType>.*) \}")
+# ThreadID, Time, IncludedFile, Version
+regex_pattern_ftd = re.compile(r"(?P<ThreadID>\d+\-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}) \|.*FTD result for .*\\(?P<IncludedFile>[^\\]+) is \#Library version: (?P<Version>.*)")
+# ThreadID, Time, ItemID
+regex_pattern_status_lt_74 = re.compile(r"(?P<ThreadID>\d+\-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}).* \| (?P<ItemID>[-0-9a-z]+)'s Status = (?P<Status>Done|Blocked)")
+regex_pattern_status_ge_74 = re.compile(r"(?P<ThreadID>\d+\-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}).* \| GetStatus was called for ID:(?P<ItemID>[-0-9a-z]+)\. Status:(?P<Status>Done|Blocked)")
+# ThreadID, Time, ItemID, PublishFileName, FileType, Reason, Details
+regex_pattern_block_reason = re.compile(r"(?P<ThreadID>\d+-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}).* \| Item Blocked\. Item ID: (?P<ItemID>[^,]+), Filename: (?P<FileName>.*?), Type: (?P<FileType>.*?), Reason: (?P<Reason>[^,]+), Details: (?P<Details>.*)$")
+
+# Time at the head of a line, in bytes to find it without decoding the line
+regex_line_time = re.compile(rb"(?:\xef\xbb\xbf)?\d+-\d+ \| (\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}\.\d{3})")
+
+
+# literal marker which must appear in the line for each pattern to match
+log_marker_dic = {
+    regex_pattern_request_received: "Sanitization Request Received",
+    regex_pattern_sanitization_started: "Sanitization Started",
+    regex_pattern_sanitization_done: "Sanitization Done",
+    regex_pattern_publish_done: "Publish Done",
+    regex_pattern_ftd: "FTD result for",
+    regex_pattern_status_lt_74: "'s Status = ",
+    regex_pattern_status_ge_74: "GetStatus was called",
+    regex_pattern_block_reason: "Item Blocked"
+}
+
+
+# {"dd/mm/YYYY HH:MM": milliseconds of the minute} shared by consecutive lines
+time_prefix_cache = {}
+
+
+def parse_time(text):
+    """
+    parse a log time "dd/mm/YYYY HH:MM:SS.fff" into milliseconds since 0001/01/01 00:00:00,
+    much faster than datetime.strptime, and durations become integer subtraction
+    :param text: time string matched by the Time group
+    """
+    prefix = text[:16]
+    minute = time_prefix_cache.get(prefix)
+    if minute is None:
+        if len(time_prefix_cache) >= 100000:
+            time_prefix_cache.clear()
+        days = date(int(text[6:10]), int(text[3:5]), int(text[0:2])).toordinal() - 1
+        minute = ((days * 24 + int(text[11:13])) * 60 + int(text[14:16])) * 60000
+        time_prefix_cache[prefix] = minute
+    return minute + int(text[17:19]) * 1000 + int(text[20:23])
+
+
+def format_time(ms):
+    """
+    format milliseconds of parse_time like str(datetime)
+    :param ms: milliseconds since 0001/01/01 00:00:00
+    """
+    return str(datetime.min + timedelta(milliseconds=ms))
+
+
+def datetime_to_ms(dt):
+    """
+    convert a datetime into milliseconds since 0001/01/01 00:00:00 like parse_time
+    """
+    return (dt - datetime.min) // timedelta(milliseconds=1)
+
+
+def parse_report_time(text):
+    """
+    parse a time written by format_time ("YYYY-mm-dd HH:MM:SS[.ffffff]") back into milliseconds like parse_time,
+    an empty or missing time is None
+    """
+    if not text:
+        return None
+    prefix = text[:16]
+    minute = time_prefix_cache.get(prefix)
+    if minute is None:
+        if len(time_prefix_cache) >= 100000:
+            time_prefix_cache.clear()
+        minute = datetime_to_ms(datetime.fromisoformat(prefix))
+        time_prefix_cache[prefix] = minute
+    return minute + int(text[17:19]) * 1000 + (int(text[20:23]) if len(text) > 19 else 0)
+
+
+def make_status_record(m):
+    return ("SanitizationLog", m.group('ItemID'),
+            {"ResponseDoneTime":parse_time(m.group('Time')),
+             "Status":m.group('Status')})
+
+
+# pattern: function of the match which returns
+#   ("SanitizationLog", item id, {Record field: value}) or
+#   ("SanitizationDoneLog" / "FtdLog", thread id, (time, file name)) for an event,
+#   which is stored as (time, file name, position of its line in the log)
+log_pattern_dic = {
+    regex_pattern_request_received:
+    lambda m: ("SanitizationLog", m.group('ItemID'),
+               {"RequestReceivedTime":parse_time(m.group('Time')),
+                "FileName":m.group('FileName'),
+                "FileSize":m.group('FileSize')
+                }),
+    regex_pattern_sanitization_started:
+    lambda m: ("SanitizationLog", m.group('ItemID'),
+               {"ThreadID":m.group('ThreadID'),
+                "SanitizationStartedTime":parse_time(m.group('Time')),
+                "FileName":m.group('FileName')}),
+    regex_pattern_sanitization_done:
+    lambda m: ("SanitizationDoneLog", m.group('ThreadID'),
+               (parse_time(m.group('Time')), m.group('FileName'))),
+    regex_pattern_publish_done:
+    lambda m: ("SanitizationLog", m.group('ItemID'),
+               {"PublishDoneTime":parse_time(m.group('Time')),
+                "PublishFileName":m.group('FileName'),
+                "FileType":m.group('FileType')}),
+    regex_pattern_ftd:
+    lambda m: ("FtdLog", m.group('ThreadID'),
+               (parse_time(m.group('Time')), m.group('IncludedFile'))),
+    regex_pattern_status_lt_74: make_status_record,
+    regex_pattern_status_ge_74: make_status_record,
+    regex_pattern_block_reason:
+    lambda m: ("SanitizationLog", m.group('ItemID'),
+               {"BlockReason":"{0}|{1}".format(m.group('Reason'), m.group('Details').strip('[]'))})
+}
+
+
+def get_dispatch_list(version):
+    """
+    make (pattern, marker) pairs to try on each line, in the order of log_pattern_dic
+    :param version: SDS version string found in the FTD log
+    """
+    if float(version[0:3]) >= 7.4:
+        skip = regex_pattern_status_lt_74
+    else:
+        skip = regex_pattern_status_ge_74
+    return [(regex, log_marker_dic[regex]) for regex in log_pattern_dic if regex is not skip]
+
+
+class Record:
+    """
+    report unit of an item, the fields which are not found yet are None
+    times are milliseconds of parse_time, durations and the included files are calculated on output
+    """
+    __slots__ = ("ThreadID", "FileName", "FileSize", "FileType", "RequestReceivedTime", "SanitizationStartedTime",
+                 "PublishDoneTime", "ResponseDoneTime", "PublishFileName", "Status", "BlockReason")
+
+    def __init__(self):
+        self.ThreadID = self.FileName = self.FileSize = self.FileType = None
+        self.RequestReceivedTime = self.SanitizationStartedTime = None
+        self.PublishDoneTime = self.ResponseDoneTime = None
+        self.PublishFileName = self.Status = self.BlockReason = None
+
+    def update(self, other):
+        """
+        overwrite the fields with the ones found in other, which comes later in the log
+        :param other: Record
+        """
+        for name in self.__slots__:
+            value = getattr(other, name)
+            if value is not None:
+                setattr(self, name, value)
+
+
+def add_record(regex, m, fragment, pos=None):
+    """
+    add the values of a match to the parse result
+    :param regex: compiled regular expression pattern, a key of log_pattern_dic
+    :param m: match object of regex
+    :param fragment: (report_dic, sanitization_done_dic, ftd_dic) being built
+    :param pos: byte offset of the line in the (decompressed) log, None when unknown
+    """
+    report_dic, sanitization_done_dic, ftd_dic = fragment
+    flag, record_id, value = log_pattern_dic[regex](m)
+    if flag == "SanitizationLog":
+        if record_id not in report_dic:
+            report_dic[record_id] = Record()
+        record = report_dic[record_id]
+        for name, field_value in value.items():
+            setattr(record, name, field_value)
+    elif flag == "SanitizationDoneLog":
+        if record_id not in sanitization_done_dic:
+            sanitization_done_dic[record_id] = []
+        sanitization_done_dic[record_id].append(value + (pos,))
+    elif flag == "FtdLog":
+        if record_id not in ftd_dic:
+            ftd_dic[record_id] = []
+        ftd_dic[record_id].append(value + (pos,))
+
+
+def make_record(regex, line, fragment, pos=None):
+    """
+    add the values found in a line to the parse result
+    :param regex: compiled regular expression pattern
+    :param line: log line
+    :param fragment: (report_dic, sanitization_done_dic, ftd_dic) being built
+    :param pos: position of the line in the log, see add_record
+    :return: match object or None
+    """
+    m = regex.match(line)
+    if m:
+        add_record(regex, m, fragment, pos)
+    return m
+
+
+def new_parse_stats():
+    """
+    make the counters of --stats
+    regex: {regex: [lines with its marker, matches, seconds in match]}
+    files: [(log, bytes, lines, seconds to parse)]
+    """
+    return {"lines": 0, "regex": {regex: [0, 0, 0.0] for regex in log_pattern_dic}, "files": [],
+            "orphan_sanitization_done": 0, "orphan_ftd": 0}
+
+
+def count_match(stats, regex, line, fragment, pos=None):
+    """
+    make_record which also counts the marker lines, matches and match time of regex
+    """
+    counter = stats["regex"][regex]
+    t = time.perf_counter()
+    m = regex.match(line)
+    counter[2] += time.perf_counter() - t
+    counter[0] += 1
+    if m:
+        counter[1] += 1
+        add_record(regex, m, fragment, pos)
+    return m
+
+
+# magic bytes of the compressed log formats
+compression_magic_list = [(b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "xz"), (b"PK\x03\x04", "zip")]
+
+
+def detect_compression(log):
+    """
+    detect the compression of a log from its magic bytes
+    :param log: log file path
+    :return: "gzip", "bz2", "xz", "zip" or None for a plain log
+    """
+    with open(log, "rb") as f:
+        head = f.read(6)
+    for magic, compression in compression_magic_list:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def read_zip_lines(zf, exact=False):
+    """
+    yield the lines of every member of a zip archive in name order
+    :param zf: zipfile.ZipFile
+    :param exact: keep the BOMs and the line ends as they are in the members, see open_log
+    """
+    for name in sorted(zf.namelist()):
+        if not name.endswith("/"):
+            with io.TextIOWrapper(zf.open(name), encoding="utf_8" if exact else "utf_8_sig",
+                                  newline="" if exact else None) as f:
+                yield from f
+
+
+@contextmanager
+def open_log(log, exact=False):
+    """
+    open a log as lines of text, decompressing gzip / bz2 / xz / zip on the fly
+    :param log: log file path
+    :param exact: keep the BOM and the line ends as they are in the log, so the byte size of the lines can be counted
+    """
+    compression = detect_compression(log)
+    if compression == "zip":
+        import zipfile
+        with zipfile.ZipFile(log) as zf:
+            yield read_zip_lines(zf, exact)
+    else:
+        with get_opener(compression)(log, "rt", encoding="utf_8" if exact else "utf_8_sig",
+                                     newline="" if exact else None) as f:
+            yield f
+
+
+def get_opener(compression):
+    """
+    :param compression: "gzip", "bz2" or "xz" of detect_compression, None for a plain log
+    :return: open function of the compression
+    """
+    if not compression:
+        return open
+    import gzip
+    import bz2
+    import lzma
+    return {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}[compression]
+
+
+def get_member_versions(zf, version):
+    """
+    find the SDS version of each member of a zip archive, which may hold the logs of different versions
+    a member whose head has no FTD line takes the version of the member before it, the first one takes version
+    :param zf: zipfile.ZipFile
+    :param version: SDS version string of the archive
+    :return: [(member name, SDS version string), ...] in name order, without the directories
+    """
+    members = []
+    for name in sorted(zf.namelist()):
+        if not name.endswith("/"):
+            with io.TextIOWrapper(zf.open(name), encoding="utf_8_sig") as f:
+                version = find_version(f) or version
+            members.append((name, version))
+    return members
+
+
+def iter_streams(log, version):
+    """
+    open a log as binary streams of its decompressed bytes, one for each zip member or one for the other logs
+    :param log: log file path
+    :param version: SDS version string of the log
+    :return: iterator of (SDS version string, binary file object), each is closed when the next one is taken
+    """
+    compression = detect_compression(log)
+    if compression == "zip":
+        import zipfile
+        with zipfile.ZipFile(log) as zf:
+            for name, member_version in get_member_versions(zf, version):
+                with zf.open(name) as f:
+                    yield member_version, f
+    else:
+        with get_opener(compression)(log, "rb") as f:
+            yield version, f
+
+
+def iter_members(log, version, exact=False):
+    """
+    open a log as lines of text like open_log, apart for each zip member with its SDS version
+    :param log: log file path
+    :param version: SDS version string of the log
+    :param exact: keep the BOMs and the line ends as they are, see open_log
+    :return: iterator of (byte offset of the member in the log, SDS version string, lines),
+             each is closed when the next one is taken
+    """
+    if detect_compression(log) == "zip":
+        import zipfile
+        with zipfile.ZipFile(log) as zf:
+            offset = 0
+            for name, member_version in get_member_versions(zf, version):
+                with io.TextIOWrapper(zf.open(name), encoding="utf_8" if exact else "utf_8_sig",
+                                      newline="" if exact else None) as f:
+                    yield offset, member_version, f
+                offset += zf.getinfo(name).file_size
+    else:
+        with open_log(log, exact) as f:
+            yield 0, version, f
+
+
+def offset_lines(lines, offset=0):
+    """
+    pair the lines of a log opened with exact=True with their byte offsets, which are the offsets parse_mapped
+    gives the lines of the same log uncompressed
+    :param lines: iterable of log lines
+    :param offset: byte offset of the first line (e.g. of a zip member in the archive)
+    :return: iterator of (offset, line), the line without a BOM
+    """
+    for line in lines:
+        if line.isascii():
+            size = len(line)
+        else:
+            size = len(line.encode())
+            if line.startswith("\ufeff"):
+                # the line starts after the BOM, like in parse_mapped
+                line = line[1:]
+                offset += 3
+                size -= 3
+        yield offset, line
+        offset += size
+
+
+def parse_lines(lines, version):
+    """
+    parse log lines into a fragment
+    :param lines: iterable of (byte offset, log line) of offset_lines or window_lines
+    :param version: SDS version string
+    :return: (report_dic, sanitization_done_dic, ftd_dic)
+    """
+    fragment = ({}, {}, {})
+    dispatch_list = get_dispatch_list(version)
+    stats = parse_stats
+    for offset, line in lines:
+        if stats is not None:
+            stats["lines"] += 1
+        # run only the patterns whose literal marker is in the line
+        for regex, marker in dispatch_list:
+            if marker in line:
+                # without the line end, like parse_mapped
+                line = line.rstrip("\r\n")
+                if stats is None:
+                    make_record(regex, line, fragment, offset)
+                else:
+                    count_match(stats, regex, line, fragment, offset)
+    return fragment
+
+
+def parse_chunk(log, start, end, version, window=None):
+    """
+    parse the byte range [start, end) of a log, which must begin and end on line boundaries
+    :param log: log file path
+    :param start: start offset
+    :param end: end offset, None to parse the whole log (a compressed log can't be split)
+    :param version: SDS version string
+    :param window: (start time, end time) of the lines to parse when the whole log is parsed, None for all lines
+    """
+    if end is None:
+        return parse_compressed(log, version, window)
+    return parse_mapped(log, start, end, version)
+
+
+def parse_compressed(log, version, window=None):
+    """
+    parse a compressed log, only its lines in a time window if a window is given
+    :param log: log file path
+    :param version: SDS version string
+    :param window: (start time, end time) in milliseconds, None for all lines
+    """
+    if window is None:
+        return parse_stream(log, version)
+    fragment = ({}, {}, {})
+    for offset, member_version, f in iter_members(log, version, exact=True):
+        merge_fragment(fragment, parse_lines(window_lines(f, window, offset), member_version))
+    return fragment
+
+
+def parse_mapped(log, start, end, version):
+    """
+    parse the byte range [start, end) of a plain log through mmap
+    the markers are searched in the mapped bytes, so only the lines containing one are decoded
+    :param log: log file path
+    :param start: start offset on a line boundary
+    :param end: end offset on a line boundary, None for the end of the log
+    :param version: SDS version string
+    """
+    fragment = ({}, {}, {})
+    dispatch_list = [(regex, marker.encode()) for regex, marker in get_dispatch_list(version)]
+    with open(log, "rb") as f:
+        if end is None:
+            end = os.fstat(f.fileno()).st_size
+        if start >= end:
+            return fragment
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if start == 0 and mm[:3] == codecs.BOM_UTF8:
+                start = 3
+            while start < end:
+                # look at about chunk_size at a time to bound the candidate list
+                if start + chunk_size >= end:
+                    window_end = end
+                else:
+                    window_end = mm.find(b"\n", start + chunk_size, end) + 1 or end
+                parse_buffer(mm, start, window_end, 0, dispatch_list, fragment)
+                start = window_end
+    return fragment
+
+
+def parse_buffer(buffer, start, end, offset, dispatch_list, fragment):
+    """
+    parse the lines of buffer[start:end] into fragment, for parse_mapped and parse_stream
+    :param buffer: mmap or bytes of the log
+    :param start: start index on a line boundary
+    :param end: end index on a line boundary
+    :param offset: offset of buffer[0] in the log, the records get offset + line start as their position
+    :param dispatch_list: [(regex, marker as bytes), ...]
+    :param fragment: (report_dic, sanitization_done_dic, ftd_dic) to add the records to
+    """
+    # (line start, pattern order, line end) of the lines containing a marker
+    candidates = []
+    find, rfind = buffer.find, buffer.rfind
+    for order, (_, marker) in enumerate(dispatch_list):
+        pos = find(marker, start, end)
+        while pos != -1:
+            line_end = find(b"\n", pos, end)
+            if line_end == -1:
+                line_end = end
+            candidates.append((rfind(b"\n", start, pos) + 1 or start, order, line_end))
+            pos = find(marker, line_end, end)
+    # in line order, like parse_lines
+    candidates.sort()
+    stats = parse_stats
+    if stats is not None:
+        stats["lines"] += buffer[start:end].count(b"\n") + (buffer[end - 1] != 10)
+    for line_start, order, line_end in candidates:
+        if buffer[line_end - 1] == 13:
+            line_end -= 1   # CRLF, which text mode reads as "\n"
+        regex = dispatch_list[order][0]
+        line = buffer[line_start:line_end].decode("utf_8")
+        if stats is None:
+            m = regex.match(line)
+            if m:
+                add_record(regex, m, fragment, offset + line_start)
+        else:
+            count_match(stats, regex, line, fragment, offset + line_start)
+
+
+def parse_stream(log, version):
+    """
+    parse a compressed log like parse_mapped, reading its decompressed bytes about chunk_size at a time
+    the positions of the records are the offsets in the decompressed bytes, the same as in the log uncompressed
+    :param log: log file path
+    :param version: SDS version string
+    """
+    fragment = ({}, {}, {})
+    offset = 0  # of the stream in the log, the members of a zip follow one another
+    for member_version, f in iter_streams(log, version):
+        dispatch_list = [(regex, marker.encode()) for regex, marker in get_dispatch_list(member_version)]
+        data = f.read(chunk_size)
+        start = 3 if data[:3] == codecs.BOM_UTF8 else 0
+        while data:
+            block = f.read(chunk_size)
+            # parse up to the last line end, the rest goes with the next block
+            end = data.rfind(b"\n") + 1 if block else len(data)
+            if end:
+                if start < end:
+                    parse_buffer(data, start, end, offset, dispatch_list, fragment)
+                offset += end
+                data = data[end:]
+                start = 0
+            data += block
+    return fragment
+
+
+def split_log(log, start=0, end=None):
+    """
+    split a log into byte ranges of about chunk_size on line boundaries
+    :param log: log file path
+    :param start: start offset on a line boundary
+    :param end: end offset on a line boundary, None for the end of the log
+    :return: list of (start, end), [(0, None)] for a compressed log
+    """
+    if detect_compression(log):
+        return [(0, None)]
+    if end is None:
+        end = os.path.getsize(log)
+    boundaries = [start]
+    with open(log, "rb") as f:
+        while boundaries[-1] + chunk_size < end:
+            f.seek(boundaries[-1] + chunk_size)
+            f.readline()
+            boundaries.append(min(f.tell(), end))
+    if boundaries[-1] < end:
+        boundaries.append(end)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def read_line_time(f, offset):
+    """
+    find the first line with a time at or after offset, syncing to the next line start unless offset is 0
+    :param f: log opened in binary mode
+    :param offset: byte offset
+    :return: (time in milliseconds, line start) or (None, end of the log)
+    """
+    f.seek(offset)
+    if offset:
+        f.readline()
+    while True:
+        pos = f.tell()
+        line = f.readline()
+        if not line:
+            return None, pos
+        m = regex_line_time.match(line)
+        if m:
+            return parse_time(m.group(1).decode()), pos
+
+
+def read_last_time(f, size):
+    """
+    find the time of the last line with a time, reading the log backwards from its end
+    :param f: log opened in binary mode
+    :param size: size of the log
+    :return: time in milliseconds or None
+    """
+    block = 65536
+    while True:
+        start = max(0, size - block)
+        f.seek(start)
+        lines = f.read(size - start).split(b"\n")
+        if start:
+            # the first line may be partial
+            lines = lines[1:]
+        for line in reversed(lines):
+            m = regex_line_time.match(line)
+            if m:
+                return parse_time(m.group(1).decode())
+        if not start:
+            return None
+        block *= 4
+
+
+def seek_time(f, size, target):
+    """
+    binary search the byte offset of the first line whose time is target or later,
+    assuming the lines are roughly in time order
+    :param f: log opened in binary mode
+    :param size: size of the log
+    :param target: time in milliseconds
+    :return: line start offset, size if every line is older
+    """
+    lo, hi = 0, size
+    while hi - lo > 65536:
+        mid = (lo + hi) // 2
+        t, _ = read_line_time(f, mid)
+        if t is None or t >= target:
+            hi = mid
+        else:
+            lo = mid
+    # the line after lo is older than target, walk from there
+    t, pos = read_line_time(f, lo)
+    while t is not None and t < target:
+        t, pos = read_line_time(f, pos + 1)
+    return pos
+
+
+def find_window_range(log, window):
+    """
+    find the byte range of a log to parse for a time window
+    :param log: log file path
+    :param window: (start time, end time) in milliseconds, None for the whole log
+    :return: (start, end) on line boundaries, (0, None) for the whole log (or a compressed log,
+             which can't be seeked), None if no line of the log is in the window
+    """
+    if not window or detect_compression(log):
+        return 0, None
+    size = os.path.getsize(log)
+    with open(log, "rb") as f:
+        first, _ = read_line_time(f, 0)
+        last = read_last_time(f, size)
+        if first is None or last < window[0] or first > window[1]:
+            return None
+        return seek_time(f, size, window[0]), seek_time(f, size, window[1] + 1)
+
+
+def window_lines(lines, window, offset=0):
+    """
+    pass the lines from the first one at or after the window start, until a line after the window end
+    lines without a time (e.g. stack traces) go with the line before them
+    :param lines: iterable of log lines of a log opened with exact=True
+    :param window: (start time, end time) in milliseconds
+    :param offset: byte offset of the first line, see offset_lines
+    :return: iterator of (offset, line), like offset_lines
+    """
+    started = False
+    for offset, line in offset_lines(lines, offset):
+        m = regex_line_time.match(line[:64].encode())
+        if m:
+            t = parse_time(m.group(1).decode())
+            if t > window[1]:
+                return
+            started = started or t >= window[0]
+        if started:
+            yield offset, line
+
+
+def merge_fragment(result, fragment):
+    """
+    merge a fragment into the result, fragments must be merged in log order
+    the records of the fragment are taken over by the result
+    :param result: (report_dic, sanitization_done_dic, ftd_dic) of the whole run
+    :param fragment: (report_dic, sanitization_done_dic, ftd_dic) of a file or a chunk
+    """
+    report_dic, sanitization_done_dic, ftd_dic = result
+    for record_id, record in fragment[0].items():
+        if record_id not in report_dic:
+            report_dic[record_id] = record
+        else:
+            report_dic[record_id].update(record)
+    for events, dic in ((sanitization_done_dic, fragment[1]), (ftd_dic, fragment[2])):
+        for thread_id, entries in dic.items():
+            if thread_id not in events:
+                events[thread_id] = []
+            events[thread_id].extend(entries)
+
+
+def find_version(lines):
+    """
+    find the SDS version in the first FTD line within the first version_scan_size characters of lines
+    :param lines: iterable of log lines
+    :return: version string or None
+    """
+    scanned = 0
+    for line in lines:
+        if "FTD result for" in line:
+            m = regex_pattern_ftd.match(line)
+            if m:
+                return m.group('Version')
+        scanned += len(line)
+        if scanned >= version_scan_size:
+            break
+    return None
+
+
+def detect_version(log):
+    """
+    find the SDS version of a log, see find_version
+    the version of a zip archive is the one of its first member with an FTD line, the members are parsed with
+    their own versions (see get_member_versions)
+    :param log: log file path
+    :return: version string or None
+    """
+    with open_log(log) as f:
+        return find_version(f)
+
+
+def detect_versions(log_list, version=None):
+    """
+    decide the SDS version of each log
+    a log whose head has no FTD line takes the version of the nearest log before it (or after it)
+    :param log_list: log file paths
+    :param version: version string to use for every log instead of detecting it
+    :return: {log: SDS version string}, without the logs whose version is unknown
+    """
+    if version:
+        return {log: version for log in log_list}
+    found = [detect_version(log) for log in log_list]
+    versions = {}
+    last = next((v for v in found if v), None)
+    for log, v in zip(log_list, found):
+        last = v or last
+        if last:
+            versions[log] = last
+    return versions
+
+
+class VersionNotFoundError(LookupError):
+    """
+    the SDS version is not found in a log
+    """
+
+
+def get_versions(log_list, version=None):
+    """
+    detect_versions which fails when the version of a log is unknown
+    :raises VersionNotFoundError: the SDS version is not found in a log
+    """
+    versions = detect_versions(log_list, version)
+    unknown = [log for log in log_list if log not in versions]
+    if unknown:
+        raise VersionNotFoundError("SDS version is not found in {}".format(", ".join(unknown)))
+    return versions
+
+
+def parse_files(log_list, versions, jobs, window=None):
+    """
+    parse whole logs, or only their lines in a time window
+    :param log_list: log file paths
+    :param versions: {log: SDS version string}
+    :param jobs: number of worker processes, 1 parses in this process
+    :param window: (start time, end time) in milliseconds, None for all lines
+    :return: iterator of sparse (report_dic, sanitization_done_dic, ftd_dic) of each log, in order
+    """
+    if jobs == 1:
+        for log in log_list:
+            if detect_compression(log):
+                yield parse_compressed(log, versions[log], window)
+            else:
+                yield parse_mapped(log, *find_window_range(log, window) or (0, 0), versions[log])
+    else:
+        ranges = [split_log(log, *find_window_range(log, window) or (0, 0)) for log in log_list]
+        tasks = [(log, start, end, versions[log], window) for log, r in zip(log_list, ranges) for start, end in r]
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            # map yields in submission order, so merging keeps the log order
+            fragments = executor.map(parse_chunk, *zip(*tasks)) if tasks else iter([])
+            for r in ranges:
+                fragment = ({}, {}, {})
+                for _ in r:
+                    merge_fragment(fragment, next(fragments))
+                yield fragment
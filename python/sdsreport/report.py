@@ -1,213 +1,317 @@
+"""
+reading logs through the parse cache, the library entry points and the report csv
+
+    python report.py LOG [REPORT]
+
+runs the command line of cli.py, like python -m sdsreport
+"""
 import os
 import sys
-import glob
-import re
 import csv
-from datetime import datetime, date, time
-
-# args
-args = sys.argv
-if len(args) == 1 or len(args) > 3:
-    print("Invalid arguments!")
-    print(r"Usage: .\collect_image_size_of_pdf.py *log*")
-    print(r"Usage: .\collect_image_size_of_pdf.py *log* report.csv")
-    exit(1)
-
-if len(args) == 3:
-    log_name = args[2]
-else:
-    log_name = 'report.csv'
-
-log_list = glob.glob(args[1])
-
-# variables
-report_dic = {}
-sanitization_done_dic = {}
-ftd_dic = {}
-
-
-# regular expression pattern
-# ThreadID, Time, ItemID, FileName, FileSize
-regex_pattern_request_received = re.compile(r"(?P<ThreadID>\d+-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}).* \| Sanitization Request Received: Request ID: (?P<ItemID>[^,]+), Source: .*\\(?P<FileName>[^,\\]+), Size: (?P<FileSize>\d+).*")
-# ThreadID, Time, ItemID, FileName
-regex_pattern_sanitization_started = re.compile(r"(?P<ThreadID>\d+-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}).* \| Sanitization Started: Item ID: (?P<ItemID>[^,]+), Filename: (?P<FileName>[^,]+), .*")
-# ThreadID, Time, FileName
-regex_pattern_sanitization_done = re.compile(r"(?P<ThreadID>\d+-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}).*\| \[10020110\] Sanitization Done \(File (?P<FileName>.*?) sanitization process successfully ended\.\)")
-# ThreadID, Time, ItemID, PublishFileName, FileType
-regex_pattern_publish_done = re.compile(r"(?P<ThreadID>\d+-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}) \| 2 Info \| Publish Done: Items: \{ Item ID: (?P<ItemID>[^,]+), Filename: (?P<FileName>[^,]+), Type: (?P<FileType>.*) \}")
-# ThreadID, Time, IncludedFile, Version
-regex_pattern_ftd = re.compile(r"(?P<ThreadID>\d+\-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}) \|.*FTD result for .*\\(?P<IncludedFile>[^\\]+) is \#Library version: (?P<Version>.*)")
-# ThreadID, Time, ItemID
-regex_pattern_status_lt_74 = re.compile(r"(?P<ThreadID>\d+\-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}).* \| (?P<ItemID>[-0-9a-z]+)'s Status = (?P<Status>Done|Blocked)")
-regex_pattern_status_ge_74 = re.compile(r"(?P<ThreadID>\d+\-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}).* \| GetStatus was called for ID:(?P<ItemID>[-0-9a-z]+)\. Status:(?P<Status>Done|Blocked)")
-# ThreadID, Time, ItemID, PublishFileName, FileType, Reason, Details
-regex_pattern_block_reason = re.compile(r"(?P<ThreadID>\d+-\d+) \| (?P<Time>\d{2}\/\d{2}\/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}).* \| Item Blocked\. Item ID: (?P<ItemID>[^,]+), Filename: (?P<FileName>.*?), Type: (?P<FileType>.*?), Reason: (?P<Reason>[^,]+), Details: (?P<Details>.*)$")
-
-# version check
-try:
-    for log in log_list:
-        with open(log, "r", encoding="utf_8_sig") as f:
-            for line in f:
-                m = regex_pattern_ftd.match(line)
-                if m:
-                    m.group('Version')
-                    version = m.group('Version')
-                    break
-except:
-    pass
-
-if float(version[0:3]) >= 7.4:
-    regex_pattern_status = regex_pattern_status_ge_74
-else:
-    regex_pattern_status = regex_pattern_status_lt_74
-
-
-log_pattern_dic = {
-    regex_pattern_request_received:
-    lambda m: ("SanitizationLog", m.group('ItemID'),
-               {"RequestReceivedTime":datetime.strptime(m.group('Time'), "%d/%m/%Y %H:%M:%S.%f"),
-                "FileName":m.group('FileName'),
-                "FileSize":m.group('FileSize')
-                }),
-    regex_pattern_sanitization_started:
-    lambda m: ("SanitizationLog", m.group('ItemID'),
-               {"ThreadID":m.group('ThreadID'),
-                "SanitizationStartedTime":datetime.strptime(m.group('Time'), "%d/%m/%Y %H:%M:%S.%f"),
-                "FileName":m.group('FileName')}),
-    regex_pattern_sanitization_done:
-    lambda m: ("SanitizationDoneLog", m.group('ThreadID'),
-               {"SanitizationDoneTime":datetime.strptime(m.group('Time'), "%d/%m/%Y %H:%M:%S.%f"),
-                "PublishFileName":m.group('FileName')}),
-    regex_pattern_publish_done:
-    lambda m: ("SanitizationLog", m.group('ItemID'),
-               {"PublishDoneTime":datetime.strptime(m.group('Time'), "%d/%m/%Y %H:%M:%S.%f"),
-                "PublishFileName":m.group('FileName'),
-                "FileType":m.group('FileType')}),
-    regex_pattern_ftd:
-    lambda m: ("FtdLog", m.group('ThreadID'),
-               {"FtdTime":datetime.strptime(m.group('Time'), "%d/%m/%Y %H:%M:%S.%f"),
-                "IncludedFile":m.group('IncludedFile'),
-                "Version":m.group('Version')}),
-    regex_pattern_status:
-    lambda m: ("SanitizationLog", m.group('ItemID'),
-               {"ResponseDoneTime":datetime.strptime(m.group('Time'), "%d/%m/%Y %H:%M:%S.%f"),
-                "Status":m.group('Status')}),
-    regex_pattern_block_reason:
-    lambda m: ("SanitizationLog", m.group('ItemID'),
-               {"BlockReason":"{0}|{1}".format(m.group('Reason'), m.group('Details').strip('[]'))})
-}
-
-
-def make_record(regex):
-    """
-    make each report unit dictionary
-    :param regex: compiled regular expression pattern
-    """
-    flag, record_id, value_dic = "", "", {}
-    m = regex.match(line)
-    if m:
-        flag, record_id, value_dic = log_pattern_dic[regex](m)
-        if flag == "SanitizationLog":
-            if record_id not in report_dic:
-                report_dic[record_id] = {"ThreadID":"", "FileName":"", "FileSize":"", "FileType":"",
-                                         "RequestReceivedTime":"", "SanitizationStartedTime":"",
-                                         "SanitizationDoneTime":"", "PublishDoneTime":"",
-                                         "ResponseDoneTime":"", "TotalProcessSeconds":"",
-                                         "UploadAndQueueWaitSeconds":"", "SanitizationProcessSeconds":"",
-                                         "PublishProcessSeconds":"", "DownloadWaitSeconds":"",
-                                         "PublishFileName":"", "Status":"", "IncludedFiles":[],
-                                         "BlockReason":""}
-            report_dic[record_id].update(value_dic)
-        elif flag == "SanitizationDoneLog":
-            if record_id not in sanitization_done_dic:
-                sanitization_done_dic[record_id] = []
-            sanitization_done_dic[record_id].append(value_dic)
-        elif flag == "FtdLog":
-            if record_id not in ftd_dic:
-                ftd_dic[record_id] = []
-            ftd_dic[record_id].append(value_dic)
-
-
-# read log and make record
-start_time = datetime.now()
-try:
-    for log in log_list:
-        print("Starting to process {} ...".format(log), file=sys.stderr)
-        with open(log, "r", encoding="utf_8_sig") as f:
-            for line in f:
-                for regex in log_pattern_dic:
-                    make_record(regex)
-except FileNotFoundError:
-    pass
-
-
-with open(log_name, 'w', encoding='utf_8_sig') as f:
-    f.write("ItemID, FileName, FileSize, FileType, RequestReceivedTime, SanitizationStartedTime, SanitizationDoneTime, PublishDoneTime, ResponseDoneTime, TotalProcessSeconds, UploadAndQueueWaitSeconds, PublishProcessSeconds, DownloadWaitSeconds, PublishFileName, IncludedFileCount, Status, BlockReason\n")
-
-
-print("Creating csv file ...")
-for item_id in report_dic:
-    thread_id = report_dic[item_id]["ThreadID"]
-
-    # Calculationg TotalProcessSeconds.
-    if report_dic[item_id]["RequestReceivedTime"] and report_dic[item_id]["ResponseDoneTime"]:
-        report_dic[item_id]["TotalProcessSeconds"] = (report_dic[item_id]["ResponseDoneTime"] - report_dic[item_id]["RequestReceivedTime"]).total_seconds()
-    
-    # Calculationg UploadAndQueueWaitSeconds.
-    if report_dic[item_id]["RequestReceivedTime"] and report_dic[item_id]["SanitizationStartedTime"]:
-        report_dic[item_id]["UploadAndQueueWaitSeconds"] = (report_dic[item_id]["SanitizationStartedTime"] - report_dic[item_id]["RequestReceivedTime"]).total_seconds()
-    
-    # Calculating PublishProcessSeconds.
-    if report_dic[item_id]["SanitizationStartedTime"] and report_dic[item_id]["PublishDoneTime"]:
-        report_dic[item_id]["PublishProcessSeconds"] = (report_dic[item_id]["PublishDoneTime"] - report_dic[item_id]["SanitizationStartedTime"]).total_seconds()
-    
-    # Calculating DownloadWaitSeconds.
-    if report_dic[item_id]["PublishDoneTime"] and report_dic[item_id]["ResponseDoneTime"]:
-        report_dic[item_id]["DownloadWaitSeconds"] = (report_dic[item_id]["ResponseDoneTime"] - report_dic[item_id]["PublishDoneTime"]).total_seconds()
-
-    # Calculating SanitizationDoneTime.
-    if thread_id in sanitization_done_dic:
-        for sanitization_done_entry in sanitization_done_dic[thread_id]:
-            if report_dic[item_id]["SanitizationStartedTime"] <= sanitization_done_entry["SanitizationDoneTime"] <= report_dic[item_id]["PublishDoneTime"]:
-                report_dic[item_id]["SanitizationDoneTime"] = sanitization_done_entry["SanitizationDoneTime"]
-
-    # count included files
-    if thread_id in ftd_dic:
-        for ftd_entry in ftd_dic[thread_id]:
-            if report_dic[item_id]["SanitizationStartedTime"] <= ftd_entry["FtdTime"] <= report_dic[item_id]["PublishDoneTime"]:
-                #if ftd_entry["IncludedFile"] not in report_dic[item_id]["IncludedFiles"]:
-                #    report_dic[item_id]["IncludedFiles"].append(ftd_entry["IncludedFile"])
-                report_dic[item_id]["IncludedFiles"].append(ftd_entry["IncludedFile"])
-    
-    included_file_count = 0 if not report_dic[item_id]["IncludedFiles"] else len(report_dic[item_id]["IncludedFiles"]) - 1
-
-    # output
-    report_format = {"ItemID": item_id,
-                     "FileName": report_dic[item_id]["FileName"],
-                     "FileSize": report_dic[item_id]["FileSize"],
-                     "FileType": report_dic[item_id]["FileType"],
-                     "RequestReceivedTime": report_dic[item_id]["RequestReceivedTime"],
-                     "SanitizationStartedTime": report_dic[item_id]["SanitizationStartedTime"],
-                     "SanitizationDoneTime": report_dic[item_id]["SanitizationDoneTime"],
-                     "PublishDoneTime": report_dic[item_id]["PublishDoneTime"],
-                     "ResponseDoneTime": report_dic[item_id]["ResponseDoneTime"],
-                     "TotalProcessSeconds": report_dic[item_id]["TotalProcessSeconds"],
-                     "UploadAndQueueWaitSeconds": report_dic[item_id]["UploadAndQueueWaitSeconds"],
-                     "PublishProcessSeconds": report_dic[item_id]["PublishProcessSeconds"],
-                     "DownloadWaitSeconds": report_dic[item_id]["DownloadWaitSeconds"],
-                     "PublishFileName": report_dic[item_id]["PublishFileName"],
-                     "IncludedFileCount": included_file_count,
-                     "Status": report_dic[item_id]["Status"],
-                     "BlockReason": report_dic[item_id]["BlockReason"]}
-    with open(log_name, 'a', encoding='utf_8_sig') as f:
-        header = report_format.keys()
-        writer = csv.DictWriter(f, fieldnames=header, lineterminator='\n')
-        writer.writerow(report_format)
-
-
-end_time = datetime.now()
-
-# how many hours take
-print("Start: {0}".format(start_time.strftime("%Y/%m/%d %H:%M:%S")))
-print("End: {0}".format(end_time.strftime("%Y/%m/%d %H:%M:%S")))
-print("Total: {0}".format(end_time - start_time))
+import glob
+import time
+import pickle
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+if not __package__:
+    # run as a script (also again in each worker process of --jobs on Windows),
+    # the other modules are imported through the package in the parent directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = "sdsreport"
+
+from . import parse
+from .parse import (window_slack, datetime_to_ms, format_time, find_window_range, merge_fragment, parse_files,
+                    get_versions)
+from .cache import get_cache_path, save_cache, evict_cache
+
+
+def read_fragments(log_list, versions, jobs, cache_dir=None, cache_size=0, window=None, progress=None):
+    """
+    read logs and make the records of each log apart, the parameters are the same as read_logs
+    the logs are parsed together (in parallel with jobs) and the cache is evicted once, after the last log
+    :return: iterator of (log, (report_dic, sanitization_done_dic, ftd_dic)) in log order
+    """
+    stats = parse.parse_stats
+    try:
+        if window:
+            log_list = [log for log in log_list if find_window_range(log, window) is not None]
+        cache_paths = {}
+        if cache_dir:
+            for log in log_list:
+                cache_paths[log] = get_cache_path(cache_dir, log, versions[log])
+        parsed = parse_files([log for log in log_list if not os.path.exists(cache_paths.get(log, ""))],
+                             versions, jobs, window)
+        for log in log_list:
+            if progress:
+                progress(log)
+            if os.path.exists(cache_paths.get(log, "")):
+                with open(cache_paths[log], "rb") as f:
+                    fragment = pickle.load(f)
+                # the mtime of an entry is its last use for eviction
+                os.utime(cache_paths[log])
+                if window:
+                    fragment = cut_window(fragment, window)
+            else:
+                if stats is None:
+                    fragment = next(parsed)
+                else:
+                    lines, t = stats["lines"], time.perf_counter()
+                    fragment = next(parsed)
+                    stats["files"].append((log, os.path.getsize(log), stats["lines"] - lines,
+                                           time.perf_counter() - t))
+                if cache_dir and not window:
+                    save_cache(cache_paths[log], fragment)
+            yield log, fragment
+    except FileNotFoundError:
+        pass
+    if cache_dir and os.path.isdir(cache_dir):
+        evict_cache(cache_dir, cache_size)
+
+
+def read_logs(log_list, versions, jobs, cache_dir=None, cache_size=0, window=None, progress=None):
+    """
+    read logs and make records
+    :param log_list: log file paths
+    :param versions: {log: SDS version string}
+    :param jobs: number of worker processes, 1 parses in this process
+    :param cache_dir: directory to keep the parse result of each log in, None not to use the cache
+    :param cache_size: max total size of the cache in bytes
+    :param window: (start time, end time) in milliseconds of the lines to parse, None for all lines;
+                   the logs with no line in the window are skipped, a cached log is cut to the window
+                   and a log parsed only for the window is not cached
+    :param progress: function called with each log before it is read (e.g. to print it), None for none
+    :return: (report_dic, sanitization_done_dic, ftd_dic)
+    """
+    result = ({}, {}, {})
+    for _, fragment in read_fragments(log_list, versions, jobs, cache_dir, cache_size, window, progress):
+        merge_fragment(result, fragment)
+    return result
+
+
+def make_window(time_from=None, time_to=None, margin=600):
+    """
+    make the time window of the log lines to read for the items received between time_from and time_to
+    :param time_from: datetime or None for no lower bound
+    :param time_to: datetime or None for no upper bound
+    :param margin: seconds of the logs read after time_to for the items received before it to complete
+    :return: (window, received) of (start, end) in milliseconds, (None, None) without bounds
+    """
+    if not time_from and not time_to:
+        return None, None
+    received_from = datetime_to_ms(time_from) if time_from else 0
+    received_to = datetime_to_ms(time_to) if time_to else datetime_to_ms(datetime.max)
+    return (received_from - window_slack, received_to + int(margin * 1000)), (received_from, received_to)
+
+
+def cut_window(fragment, window):
+    """
+    keep the events of the fragment of a whole log in a time window, like parsing only the lines in the window;
+    the records are kept whole, filter_received picks the items of the window
+    :param fragment: (report_dic, sanitization_done_dic, ftd_dic)
+    :param window: (start time, end time) in milliseconds
+    :return: (report_dic, sanitization_done_dic, ftd_dic)
+    """
+    report_dic, sanitization_done_dic, ftd_dic = fragment
+    start, end = window
+
+    def cut(event_dic):
+        return {thread_id: [e for e in entries if start <= e[0] <= end] for thread_id, entries in event_dic.items()}
+
+    return report_dic, cut(sanitization_done_dic), cut(ftd_dic)
+
+
+def read_window(log_list, versions, jobs, cache_dir=None, cache_size=0, time_from=None, time_to=None, margin=600,
+                progress=None):
+    """
+    read_logs only the items received between time_from and time_to, see make_window
+    :return: (report_dic, sanitization_done_dic, ftd_dic)
+    """
+    window, received = make_window(time_from, time_to, margin)
+    report_dic, sanitization_done_dic, ftd_dic = read_logs(log_list, versions, jobs, cache_dir, cache_size, window,
+                                                           progress)
+    return filter_received(report_dic, received), sanitization_done_dic, ftd_dic
+
+
+def filter_received(report_dic, received):
+    """
+    keep the items received in the range of make_window
+    the items received before the window have lost their first lines
+    :param report_dic: {item_id: Record}
+    :param received: (start, end) in milliseconds, None to keep every item
+    """
+    if not received:
+        return report_dic
+    return {item_id: record for item_id, record in report_dic.items()
+            if record.RequestReceivedTime is not None and received[0] <= record.RequestReceivedTime <= received[1]}
+
+
+def load_logs(paths, version=None, jobs=1, cache_dir=None, cache_size=0, time_from=None, time_to=None, margin=600,
+              progress=None):
+    """
+    read logs given as a glob pattern or a list, see parse_logs
+    """
+    log_list = glob.glob(paths) if isinstance(paths, str) else list(paths)
+    return read_window(log_list, get_versions(log_list, version), jobs, cache_dir, cache_size,
+                       time_from, time_to, margin, progress)
+
+
+def parse_logs(paths, version=None, jobs=1, cache_dir=None, cache_size=0, time_from=None, time_to=None,
+               margin=600, progress=None):
+    """
+    parse SDS logs into the records of their items, the library entry point
+    :param paths: glob pattern, or list of log file paths in log order
+    :param version: SDS version of every log (e.g. "7.4"), None to detect it from each log
+    :param jobs: number of worker processes, 1 parses in this process
+    :param cache_dir: directory to keep the parse result of each log in, None not to use the cache
+    :param cache_size: max total size of the cache in bytes
+    :param time_from: datetime, only the items received at or after it
+    :param time_to: datetime, only the items received at or before it
+    :param margin: seconds of the logs read after time_to for the items received before it to complete
+    :param progress: function called with each log before it is read (e.g. to print it), None for none
+    :return: iterator of (item id, Record)
+    :raises VersionNotFoundError: the SDS version is not found in a log
+    """
+    return iter(load_logs(paths, version, jobs, cache_dir, cache_size, time_from, time_to, margin,
+                          progress)[0].items())
+
+
+def build_report(paths, version=None, jobs=1, cache_dir=None, cache_size=0, time_from=None, time_to=None,
+                 margin=600, progress=None):
+    """
+    parse SDS logs and join their events like the report csv, the parameters are the same as parse_logs
+    :return: iterator of row dictionaries with report_fields keys
+    :raises VersionNotFoundError: the SDS version is not found in a log
+    """
+    return make_report_rows(*load_logs(paths, version, jobs, cache_dir, cache_size, time_from, time_to, margin,
+                                       progress))
+
+
+# columns of the report csv
+report_fields = ["ItemID", "FileName", "FileSize", "FileType", "RequestReceivedTime", "SanitizationStartedTime",
+                 "SanitizationDoneTime", "PublishDoneTime", "ResponseDoneTime", "TotalProcessSeconds",
+                 "UploadAndQueueWaitSeconds", "PublishProcessSeconds", "DownloadWaitSeconds", "PublishFileName",
+                 "IncludedFileCount", "Status", "BlockReason"]
+
+
+def make_event_index(event_dic):
+    """
+    sort the events of each thread by time for bisect lookups
+    :param event_dic: {thread_id: [(time, file name, position), ...]}
+    :return: {thread_id: (sorted times, positions of the events in the original list)}
+    """
+    index = {}
+    for thread_id, entries in event_dic.items():
+        order = sorted(range(len(entries)), key=lambda i: entries[i][0])
+        index[thread_id] = ([entries[i][0] for i in order], order)
+    return index
+
+
+def find_events(index, thread_id, start, end):
+    """
+    find the events of a thread whose time is between start and end (inclusive)
+    :param index: result of make_event_index
+    :param thread_id: thread id
+    :param start: start time or None if unknown
+    :param end: end time or None if unknown
+    :return: positions of the events in the original list, in time order
+    """
+    if thread_id not in index or start is None or end is None:
+        return []
+    times, order = index[thread_id]
+    return order[bisect_left(times, start):bisect_right(times, end)]
+
+
+def make_report_rows(report_dic, sanitization_done_dic, ftd_dic):
+    """
+    calculate the durations of each item and yield its csv row
+    :param report_dic: {item_id: Record}
+    :param sanitization_done_dic: {thread_id: [(SanitizationDone time, publish file name, position), ...]}
+    :param ftd_dic: {thread_id: [(FTD time, included file name, position), ...]}
+    """
+    sanitization_done_index = make_event_index(sanitization_done_dic)
+    ftd_index = make_event_index(ftd_dic)
+    # (thread_id, position) of the events joined to an item, for the orphan counts of --stats
+    stats = parse.parse_stats
+    joined_sanitization_done, joined_ftd = set(), set()
+    for item_id, record in report_dic.items():
+        thread_id = record.ThreadID
+        received, started = record.RequestReceivedTime, record.SanitizationStartedTime
+        published, responded = record.PublishDoneTime, record.ResponseDoneTime
+
+        # Calculationg TotalProcessSeconds.
+        total_process_seconds = ""
+        if received is not None and responded is not None:
+            total_process_seconds = (responded - received) / 1000
+
+        # Calculationg UploadAndQueueWaitSeconds.
+        upload_and_queue_wait_seconds = ""
+        if received is not None and started is not None:
+            upload_and_queue_wait_seconds = (started - received) / 1000
+
+        # Calculating PublishProcessSeconds.
+        publish_process_seconds = ""
+        if started is not None and published is not None:
+            publish_process_seconds = (published - started) / 1000
+
+        # Calculating DownloadWaitSeconds.
+        download_wait_seconds = ""
+        if published is not None and responded is not None:
+            download_wait_seconds = (responded - published) / 1000
+
+        # Calculating SanitizationDoneTime. (the last one in log order wins)
+        sanitization_done_time = None
+        positions = find_events(sanitization_done_index, thread_id, started, published)
+        if positions:
+            sanitization_done_time = sanitization_done_dic[thread_id][max(positions)][0]
+
+        # count included files
+        included_files = find_events(ftd_index, thread_id, started, published)
+        included_file_count = 0 if not included_files else len(included_files) - 1
+
+        if stats is not None:
+            joined_sanitization_done.update((thread_id, i) for i in positions)
+            joined_ftd.update((thread_id, i) for i in included_files)
+
+        # output
+        report_format = {"ItemID": item_id,
+                         "FileName": record.FileName or "",
+                         "FileSize": record.FileSize or "",
+                         "FileType": record.FileType or "",
+                         "RequestReceivedTime": "" if received is None else format_time(received),
+                         "SanitizationStartedTime": "" if started is None else format_time(started),
+                         "SanitizationDoneTime": "" if sanitization_done_time is None else format_time(sanitization_done_time),
+                         "PublishDoneTime": "" if published is None else format_time(published),
+                         "ResponseDoneTime": "" if responded is None else format_time(responded),
+                         "TotalProcessSeconds": total_process_seconds,
+                         "UploadAndQueueWaitSeconds": upload_and_queue_wait_seconds,
+                         "PublishProcessSeconds": publish_process_seconds,
+                         "DownloadWaitSeconds": download_wait_seconds,
+                         "PublishFileName": record.PublishFileName or "",
+                         "IncludedFileCount": included_file_count,
+                         "Status": record.Status or "",
+                         "BlockReason": record.BlockReason or ""}
+        yield report_format
+
+    if stats is not None:
+        stats["orphan_sanitization_done"] = sum(map(len, sanitization_done_dic.values())) - \
+            len(joined_sanitization_done)
+        stats["orphan_ftd"] = sum(map(len, ftd_dic.values())) - len(joined_ftd)
+
+
+def write_report(log_name, rows, buffer_size):
+    """
+    write the report csv through a single file handle
+    :param log_name: output csv path
+    :param rows: iterable of row dictionaries with report_fields keys
+    :param buffer_size: write buffer size in bytes
+    """
+    with open(log_name, 'w', encoding='utf_8_sig', buffering=buffer_size) as f:
+        writer = csv.DictWriter(f, fieldnames=report_fields, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    from .cli import main
+    main()
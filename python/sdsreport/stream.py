@@ -0,0 +1,196 @@
+"""
+making the rows of items as soon as they are complete, for --stream and --follow
+"""
+import os
+import io
+import heapq
+from collections import deque
+
+from .parse import (chunk_size, regex_pattern_sanitization_started, regex_pattern_status_lt_74,
+                    regex_pattern_status_ge_74, parse_time, get_dispatch_list, make_record, detect_compression,
+                    iter_members)
+from .report import make_report_rows
+
+
+def prune_events(entries, bound):
+    """
+    drop the leading events older than bound from a thread's event list
+    :param entries: [(time, file name, position), ...] in log order
+    :param bound: oldest time still needed
+    """
+    i = 0
+    while i < len(entries) and entries[i][0] < bound:
+        i += 1
+    del entries[:i]
+
+
+def new_stream_state():
+    """
+    make the in-flight state of stream_report_rows, which can be pickled for a checkpoint
+    """
+    return {"report_dic": {}, "sanitization_done_dic": {}, "ftd_dic": {},
+            "pending": [],          # heap of (deadline, serial, item_id)
+            "serial": 0,
+            "open_threads": {},     # {thread_id: {item_id, ...}} of started items not emitted yet
+            "last_seen": {},        # {item_id: time of its last line} of the items not emitted yet
+            "expiry": [],           # heap of (time to check the age at, serial, item_id) for max_open
+            "done_ids": set(),      # recently emitted items, to drop their late lines
+            "done_queue": deque(),
+            "now": None}
+
+
+def stream_report_rows(lines, version, grace, state=None, finish_all=True, max_open=None):
+    """
+    yield the csv row of each item as soon as it is complete, keeping only in-flight state
+    an item is complete when the log time passes its status line time plus grace,
+    so late SanitizationDone / FTD / Item Blocked lines are still joined;
+    rows come in completion order, and items without a status line are emitted when they are older than max_open
+    or at the end
+    :param lines: iterable of log lines
+    :param version: SDS version string, may be None when lines is empty
+    :param grace: seconds to wait for late lines after the status line
+    :param state: result of new_stream_state to continue from, updated in place
+    :param finish_all: emit every open item at the end of lines
+    :param max_open: seconds after the last line of an item to emit it incomplete, None to wait until the end;
+                     without it an item whose status line is missing keeps the events of its thread in memory
+    """
+    if state is None:
+        state = new_stream_state()
+    report_dic, sanitization_done_dic, ftd_dic = fragment = \
+        (state["report_dic"], state["sanitization_done_dic"], state["ftd_dic"])
+    pending, open_threads = state["pending"], state["open_threads"]
+    done_ids, done_queue = state["done_ids"], state["done_queue"]
+    last_seen, expiry = state["last_seen"], state["expiry"]
+    dispatch_list = get_dispatch_list(version) if version else []
+    grace = int(grace * 1000)
+    max_open = int(max_open * 1000) if max_open else None
+
+    def finish(item_id):
+        record = report_dic.pop(item_id)
+        last_seen.pop(item_id, None)
+        thread_id = record.ThreadID
+        row = next(make_report_rows({item_id: record},
+                                    {thread_id: sanitization_done_dic.get(thread_id, [])},
+                                    {thread_id: ftd_dic.get(thread_id, [])}))
+        done_ids.add(item_id)
+        done_queue.append(item_id)
+        if len(done_queue) > 100000:
+            done_ids.discard(done_queue.popleft())
+
+        # drop the events of the thread no open item can match anymore
+        if thread_id in open_threads:
+            open_ids = open_threads[thread_id] = {i for i in open_threads[thread_id] if i in report_dic}
+            bound = state["now"] - grace
+            for open_id in open_ids:
+                bound = min(bound, report_dic[open_id].SanitizationStartedTime)
+            prune_events(sanitization_done_dic.get(thread_id, []), bound)
+            prune_events(ftd_dic.get(thread_id, []), bound)
+        return row
+
+    for line in lines:
+        # run only the patterns whose literal marker is in the line
+        for regex, marker in dispatch_list:
+            if marker in line:
+                m = make_record(regex, line, fragment)
+                if not m:
+                    continue
+                if "ItemID" in regex.groupindex and m.group('ItemID') in done_ids:
+                    # a line after the grace window of an emitted item (e.g. a repeated status call)
+                    report_dic.pop(m.group('ItemID'), None)
+                    continue
+                now = state["now"] = parse_time(m.group('Time'))
+                if max_open and "ItemID" in regex.groupindex:
+                    item_id = m.group('ItemID')
+                    if item_id not in last_seen:
+                        heapq.heappush(expiry, (now + max_open, state["serial"], item_id))
+                        state["serial"] += 1
+                    last_seen[item_id] = now
+                if regex is regex_pattern_sanitization_started:
+                    open_threads.setdefault(m.group('ThreadID'), set()).add(m.group('ItemID'))
+                elif regex is regex_pattern_status_lt_74 or regex is regex_pattern_status_ge_74:
+                    heapq.heappush(pending, (now + grace, state["serial"], m.group('ItemID')))
+                    state["serial"] += 1
+                while pending and pending[0][0] < now:
+                    item_id = heapq.heappop(pending)[2]
+                    if item_id in report_dic:
+                        yield finish(item_id)
+                while expiry and expiry[0][0] < now:
+                    item_id = heapq.heappop(expiry)[2]
+                    if item_id not in report_dic:
+                        continue
+                    if last_seen[item_id] + max_open < now:
+                        # no line of the item for max_open, emit it incomplete and stop pinning its thread
+                        yield finish(item_id)
+                    else:
+                        heapq.heappush(expiry, (last_seen[item_id] + max_open, state["serial"], item_id))
+                        state["serial"] += 1
+
+    if finish_all:
+        # the end of input completes everything still open
+        while pending:
+            item_id = heapq.heappop(pending)[2]
+            if item_id in report_dic:
+                yield finish(item_id)
+        for item_id in list(report_dic):
+            yield finish(item_id)
+
+
+def stream_logs(log_list, versions, grace, max_open=None, progress=None):
+    """
+    yield the csv rows of logs read one after another in order, see stream_report_rows
+    :param log_list: log file paths
+    :param versions: {log: SDS version string}
+    :param grace: seconds to wait for late lines after the status line
+    :param max_open: seconds after the last line of an item to emit it incomplete, None to wait until the end
+    :param progress: function called with each log before it is read (e.g. to print it), None for none
+    """
+    state = new_stream_state()
+    for log in log_list:
+        if progress:
+            progress(log)
+        try:
+            # the members of a zip archive may have different versions
+            for _, version, lines in iter_members(log, versions[log]):
+                yield from stream_report_rows(lines, version, grace, state, finish_all=False, max_open=max_open)
+        except FileNotFoundError:
+            pass
+    yield from stream_report_rows([], None, grace, state)
+
+
+def read_new_lines(log, offsets, version):
+    """
+    yield blocks of the complete lines appended to a log since the last call
+    a log is identified by its device and inode, so a renamed (rotated) log continues
+    from its offset, and a log smaller than its offset (truncated) is read from the start
+    :param log: log file path
+    :param offsets: {(st_dev, st_ino): byte offset}, updated in place
+    :param version: SDS version string of the log
+    :return: iterator of (SDS version string, lines), the version differs for the members of a zip archive
+    """
+    try:
+        st = os.stat(log)
+    except FileNotFoundError:
+        return
+    identity = (st.st_dev, st.st_ino)
+    offset = offsets.get(identity, 0)
+    if detect_compression(log):
+        # a compressed log is an archive which doesn't grow, read it once
+        if offset != st.st_size:
+            for _, member_version, lines in iter_members(log, version):
+                yield member_version, lines
+            offsets[identity] = st.st_size
+        return
+    if st.st_size < offset:
+        offset = 0
+    while offset < st.st_size:
+        with open(log, "rb") as f:
+            f.seek(offset)
+            data = f.read(min(chunk_size, st.st_size - offset))
+        # keep a partly written last line for the next call
+        end = data.rfind(b"\n") + 1
+        if not end:
+            break
+        with io.TextIOWrapper(io.BytesIO(data[:end]), encoding="utf_8_sig" if offset == 0 else "utf_8") as f:
+            yield version, f
+        offset += end
+        offsets[identity] = offset
@@ -0,0 +1,151 @@
+"""
+mergeable latency sketches and the summary csv of duration percentiles
+"""
+import csv
+import math
+from bisect import bisect_right
+
+from .parse import parse_report_time, format_time
+
+
+# relative error of the percentiles in the summary csv
+sketch_accuracy = 0.01
+
+
+# durations summarized in the summary csv
+summary_metrics = ["TotalProcessSeconds", "UploadAndQueueWaitSeconds", "PublishProcessSeconds", "DownloadWaitSeconds"]
+
+# columns of the summary csv
+summary_fields = ["Dimension", "Key", "Metric", "Count", "Mean", "Min", "p50", "p95", "p99", "Max"]
+
+summary_quantiles = [("p50", 0.5), ("p95", 0.95), ("p99", 0.99)]
+
+
+class LatencySketch:
+    """
+    log-bucketed histogram of durations, whose percentiles are within sketch_accuracy of the exact ones
+    two sketches are merged by adding up their bucket counts, so it doesn't matter how the rows were split
+    """
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    gamma = (1 + sketch_accuracy) / (1 - sketch_accuracy)
+    log_gamma = math.log(gamma)
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = {}   # {bucket index: count}, negative indexes for negative durations
+
+    def bucket_index(self, value):
+        if value == 0:
+            return 0
+        index = int(math.ceil(math.log(abs(value) * 1000) / self.log_gamma)) + 1
+        return index if value > 0 else -index
+
+    def bucket_value(self, index):
+        if index == 0:
+            return 0.0
+        value = 2 * self.gamma ** (abs(index) - 1) / (self.gamma + 1) / 1000
+        return value if index > 0 else -value
+
+    def add(self, value):
+        index = self.bucket_index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def rank_table(self):
+        """
+        make (cumulative counts, values) of the buckets in value order for rank lookups
+        """
+        cumulative, values = [], []
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            cumulative.append(seen)
+            # the exact min and max are better than their bucket values
+            values.append(min(max(self.bucket_value(index), self.min), self.max))
+        return cumulative, values
+
+    def quantile(self, q, table=None):
+        """
+        :param q: 0 to 1
+        :param table: rank_table of the sketch to reuse
+        """
+        cumulative, values = table or self.rank_table()
+        return values[bisect_right(cumulative, q * (self.count - 1))]
+
+
+def summarize_rows(rows, summary_dic, bucket_minutes):
+    """
+    add the durations of each row to the sketches of its groups and pass the row through
+    the groups are all items, FileType, Status, BlockReason and the time bucket of RequestReceivedTime
+    :param rows: iterable of row dictionaries with report_fields keys
+    :param summary_dic: {(dimension, key, metric): LatencySketch}, updated in place
+    :param bucket_minutes: length of a time bucket in minutes
+    """
+    bucket_ms = int(bucket_minutes * 60 * 1000)
+    for row in rows:
+        received = parse_report_time(row["RequestReceivedTime"])
+        time_bucket = ""
+        if received is not None:
+            time_bucket = format_time(received - received % bucket_ms)
+        groups = [("All", ""), ("FileType", row["FileType"]), ("Status", row["Status"]),
+                  ("BlockReason", row["BlockReason"]), ("TimeBucket", time_bucket)]
+        for metric in summary_metrics:
+            value = row[metric]
+            if value == "":
+                continue
+            for dimension, key in groups:
+                sketch = summary_dic.get((dimension, key, metric))
+                if sketch is None:
+                    sketch = summary_dic[(dimension, key, metric)] = LatencySketch()
+                sketch.add(value)
+        yield row
+
+
+def merge_summary(summary_dic, other_dic):
+    """
+    merge the sketches of another run into summary_dic
+    """
+    for group, sketch in other_dic.items():
+        if group in summary_dic:
+            summary_dic[group].merge(sketch)
+        else:
+            summary_dic[group] = sketch
+
+
+def write_summary(summary_name, summary_dic):
+    """
+    write the count, mean, min, percentiles and max of each sketch to the summary csv
+    :param summary_name: output csv path
+    :param summary_dic: {(dimension, key, metric): LatencySketch}
+    """
+    dimension_order = {"All": 0, "FileType": 1, "Status": 2, "BlockReason": 3, "TimeBucket": 4}
+    with open(summary_name, 'w', encoding='utf_8_sig') as f:
+        writer = csv.DictWriter(f, fieldnames=summary_fields, lineterminator='\n')
+        writer.writeheader()
+        for (dimension, key, metric) in sorted(summary_dic, key=lambda g: (dimension_order.get(g[0], 5), g[1],
+                                                                            summary_metrics.index(g[2]))):
+            sketch = summary_dic[(dimension, key, metric)]
+            summary_format = {"Dimension": dimension, "Key": key, "Metric": metric, "Count": sketch.count,
+                              "Mean": round(sketch.total / sketch.count, 3), "Min": sketch.min, "Max": sketch.max}
+            for name, q in summary_quantiles:
+                summary_format[name] = round(sketch.quantile(q), 3)
+            writer.writerow(summary_format)
@@ -0,0 +1,94 @@
+"""
+per-second timeline of the item states and the throughput
+"""
+import csv
+
+from .parse import parse_report_time, format_time
+from .report import report_fields
+
+
+# states of an item in the timeline, and the report columns of the times it enters and leaves them
+timeline_states = [("Queued", "RequestReceivedTime", "SanitizationStartedTime"),
+                   ("Sanitizing", "SanitizationStartedTime", "SanitizationDoneTime"),
+                   ("Publishing", "SanitizationDoneTime", "PublishDoneTime"),
+                   ("WaitingDownload", "PublishDoneTime", "ResponseDoneTime")]
+
+# columns of the timeline csv, the states are the mean number of items in them during the second
+timeline_fields = ["Time"] + [state for state, _, _ in timeline_states] + ["ReceivedPerSec", "RespondedPerSec"]
+
+
+def add_timeline(rows, timeline):
+    """
+    add the time each item spends in each state to the timeline and pass the row through
+    an interval adds +1 / -1 to the seconds it covers fully and the milliseconds it covers to the seconds at its ends,
+    so the timeline only grows with the seconds of the logs and make_timeline sweeps it once in time order
+    :param rows: iterable of row dictionaries with report_fields keys
+    :param timeline: {second: [full second deltas of each state..., milliseconds of each state...,
+                      received, responded]}, updated in place
+    """
+    n = len(timeline_states)
+    time_names = [name for name in report_fields if name.endswith("Time")]
+
+    def counters(second):
+        c = timeline.get(second)
+        if c is None:
+            c = timeline[second] = [0] * (2 * n + 2)
+        return c
+
+    for row in rows:
+        times = {name: parse_report_time(row[name]) for name in time_names}
+        if times["SanitizationDoneTime"] is None:
+            # without the SanitizationDone line the item is sanitizing until the publish
+            times["SanitizationDoneTime"] = times["PublishDoneTime"]
+        for i, (_, enter, leave) in enumerate(timeline_states):
+            start, end = times[enter], times[leave]
+            if start is None or end is None or end <= start:
+                continue
+            first, last = start // 1000, end // 1000
+            if first == last:
+                counters(first)[n + i] += end - start
+            else:
+                counters(first)[n + i] += 1000 - start % 1000
+                c = counters(last)
+                c[n + i] += end % 1000
+                if first + 1 < last:
+                    counters(first + 1)[i] += 1
+                    c[i] -= 1
+        for j, name in ((2 * n, "RequestReceivedTime"), (2 * n + 1, "ResponseDoneTime")):
+            if times[name] is not None:
+                counters(times[name] // 1000)[j] += 1
+        yield row
+
+
+def make_timeline(timeline):
+    """
+    sweep the timeline in time order and yield a row for every second from the first to the last
+    :param timeline: result of add_timeline
+    """
+    n = len(timeline_states)
+    if not timeline:
+        return
+    seconds = sorted(timeline)
+    full = [0] * n
+    empty = [0] * (2 * n + 2)
+    for second in range(seconds[0], seconds[-1] + 1):
+        counters = timeline.get(second, empty)
+        timeline_format = {"Time": format_time(second * 1000)}
+        for i, (state, _, _) in enumerate(timeline_states):
+            full[i] += counters[i]
+            timeline_format[state] = round(full[i] + counters[n + i] / 1000, 3)
+        timeline_format["ReceivedPerSec"] = counters[2 * n]
+        timeline_format["RespondedPerSec"] = counters[2 * n + 1]
+        yield timeline_format
+
+
+def write_timeline(timeline_name, timeline):
+    """
+    write the timeline csv
+    :param timeline_name: output csv path
+    :param timeline: result of add_timeline
+    """
+    with open(timeline_name, 'w', encoding='utf_8_sig') as f:
+        writer = csv.DictWriter(f, fieldnames=timeline_fields, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(make_timeline(timeline))
@@ -1,6 +1,11 @@
 import csv
+import json
+import os
 import re
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
 
 from bs4 import BeautifulSoup
@@ -8,62 +13,183 @@ import requests
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 
+from throttle import Throttle
+
 url_base = 'https://www.j-lis.go.jp/'
 headers_ = {'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/70.0.3538.77 Safari/537.36'}
+# only connection errors are retried here, 429/5xx (and their Retry-After) are retried by throttle_,
+# which counts them and slows the host down
 retries_ = Retry(total=3,
                  backoff_factor=0.3,
-                 status_forcelist=(500, 502, 503, 504))
+                 status=0,
+                 respect_retry_after_header=False)
 timeout_ = 10
+max_workers_ = 32       # links checked at the same time
+host_limit_ = 4         # upper limit of the links checked at the same time on one host
+host_rate_ = 5          # requests per second to one host
+cache_file_ = 'local_gov_urls_cache.json'   # delete it to check everything again
+index_ttl_ = 24 * 60 * 60       # seconds an index page is used without asking the server
+live_ttl_ = 3 * 24 * 60 * 60    # seconds a live link is not checked again
 regex_prefecture = re.compile('都$|道央|道南|道北|道東|府$|県$')
 regex_cities = re.compile('都$|道$|府$|県$|市$|区$|町$|村$')
-result = {}
 
 
-def get_link_from_html(link, regex):
+def make_session():
+    # one session for every request, so the connections (and TLS sessions) to a host are kept alive and reused
     s = requests.Session()
-    s.mount('https://', HTTPAdapter(max_retries=retries_))
-    s.mount('http://', HTTPAdapter(max_retries=retries_))
+    adapter = HTTPAdapter(max_retries=retries_, pool_connections=max_workers_, pool_maxsize=host_limit_)
+    s.mount('https://', adapter)
+    s.mount('http://', adapter)
+    s.headers.update(headers_)
+    return s
+
+
+session_ = make_session()
+throttle_ = Throttle(rate=host_rate_, burst=host_limit_, max_concurrency=host_limit_, backoff_factor=0.3)
+cache_ = {}     # {url: {'etag', 'last_modified', 'status', 'checked'[, 'pattern', 'links']}}
+cache_lock_ = threading.Lock()
+
+
+def load_cache():
+    if os.path.exists(cache_file_):
+        try:
+            with open(cache_file_, encoding='utf-8') as f:
+                cache_.update(json.load(f))
+        except (OSError, ValueError) as e:
+            print('Ignoring the cache: {}'.format(e))
+
+
+def save_cache():
+    with cache_lock_:
+        with open(cache_file_ + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(cache_, f, ensure_ascii=False)
+        os.replace(cache_file_ + '.tmp', cache_file_)
+
+
+def get_cache_entry(url):
+    with cache_lock_:
+        return cache_.get(url)
+
+
+def set_cache_entry(url, r, status, **extra):
+    # keep the validators of the response to ask the server next time if the url has changed
+    entry = {'etag': r.headers.get('ETag') if r is not None else None,
+             'last_modified': r.headers.get('Last-Modified') if r is not None else None,
+             'status': status, 'checked': time.time()}
+    entry.update(extra)
+    with cache_lock_:
+        cache_[url] = entry
+
+
+def touch_cache_entry(url):
+    # the server answered 304 Not Modified
+    with cache_lock_:
+        cache_[url]['checked'] = time.time()
+        return cache_[url]
+
+
+def get_conditional_headers(entry):
+    headers = {}
+    if entry and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry and entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def get_link_from_html(link, regex):
+    # (text, href) of the links whose text matches regex, an unchanged page isn't parsed again
+    url = urljoin(url_base, link)
+    entry = get_cache_entry(url)
+    if not entry or entry.get('pattern') != regex.pattern:
+        entry = None
+    elif time.time() - entry['checked'] < index_ttl_:
+        return [tuple(a) for a in entry['links']]
 
     try:
-        r = s.request('GET', urljoin(url_base, link), timeout=timeout_ , headers=headers_, )
+        r = throttle_.request(session_, 'GET', url, timeout=timeout_, headers=get_conditional_headers(entry))
     except OSError as e:
         print('OS Error: {}'.format(e))
         sys.exit()
+    if r.status_code == 304:
+        return [tuple(a) for a in touch_cache_entry(url)['links']]
     soup = BeautifulSoup(r.content, 'lxml')
-    return soup.find_all('a', text=regex)
+    links = [(str(a.string), a.get('href')) for a in soup.find_all('a', text=regex)]
+    if r.status_code == 200:
+        set_cache_entry(url, r, r.status_code, pattern=regex.pattern, links=links)
+    return links
 
 
 def get_response_code(link):
-    print('Getting response code from {} ...'.format(link))
-    s = requests.Session()
-    s.mount('https://', HTTPAdapter(max_retries=retries_))
-    s.mount('http://', HTTPAdapter(max_retries=retries_))
+    # a link found live recently isn't checked again, the others are asked if they have changed since
+    entry = get_cache_entry(link)
+    if entry and isinstance(entry['status'], int) and entry['status'] < 400 and \
+            time.time() - entry['checked'] < live_ttl_:
+        return entry['status']
+    headers = get_conditional_headers(entry)
 
+    print('Getting response code from {} ...'.format(link))
+    # HEAD first, some servers don't support it or answer it differently, so check an error with GET
     try:
-        r = s.request('GET', link, timeout=timeout_ , headers=headers_, )
-    except:
+        r = throttle_.request(session_, 'HEAD', link, timeout=timeout_, allow_redirects=True, headers=headers)
+        if r.status_code == 304:
+            return touch_cache_entry(link)['status']
+        if r.status_code < 400:
+            set_cache_entry(link, r, r.status_code)
+            return r.status_code
+    except requests.exceptions.ConnectionError:
+        # GET can't connect either, don't wait for its retries again
+        set_cache_entry(link, None, 'Dead')
         return 'Dead'
-    return r.status_code
-
-
-# scraping
-print('Scraping link from site ...')
-for link in get_link_from_html('spd/map-search/cms_1069.html', regex_prefecture):
-    for link in get_link_from_html(link.get('href'), regex_cities):
-        if link.string.strip() not in result:
-            result[link.string.strip()] = [link.get('href'), get_response_code(link.get('href'))]
-
-
-# output
-print('Writing to csv ...')
-try:
-    with open('local_gov_urls.csv', 'w', encoding='utf-8_sig') as f:
-        writer = csv.writer(f, lineterminator='\n')
-        writer.writerow(['地方公共団体', 'URL', 'Status'])
-        for key, value in result.items():
-            city, (url, status) = key, value
-            writer.writerow([city, url, status])
-except OSError as e:
-    print('OS Error: {}'.format(e))
-else:
-    print('Writing to csv is successfully ended.')
+    except Exception:
+        pass
+    # stream=True reads only the status line and headers, closing the response drops the body
+    try:
+        with throttle_.request(session_, 'GET', link, timeout=timeout_, stream=True, headers=headers) as r:
+            if r.status_code == 304:
+                return touch_cache_entry(link)['status']
+            set_cache_entry(link, r, r.status_code)
+            return r.status_code
+    except Exception:
+        set_cache_entry(link, None, 'Dead')
+        return 'Dead'
+
+
+def get_response_codes(links):
+    # check the links concurrently, the codes are in the order of links
+    with ThreadPoolExecutor(max_workers=max_workers_) as executor:
+        return list(executor.map(get_response_code, links))
+
+
+def main():
+    result = {}
+    load_cache()
+
+    # scraping
+    print('Scraping link from site ...')
+    for _, prefecture_link in get_link_from_html('spd/map-search/cms_1069.html', regex_prefecture):
+        for city, link in get_link_from_html(prefecture_link, regex_cities):
+            if city.strip() not in result:
+                result[city.strip()] = [link, None]
+    for value, status in zip(result.values(), get_response_codes([url for url, _ in result.values()])):
+        value[1] = status
+    save_cache()
+    throttle_.print_stats()
+
+    # output
+    print('Writing to csv ...')
+    try:
+        with open('local_gov_urls.csv', 'w', encoding='utf-8_sig') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(['地方公共団体', 'URL', 'Status'])
+            for key, value in result.items():
+                city, (url, status) = key, value
+                writer.writerow([city, url, status])
+    except OSError as e:
+        print('OS Error: {}'.format(e))
+    else:
+        print('Writing to csv is successfully ended.')
+
+
+if __name__ == '__main__':
+    main()
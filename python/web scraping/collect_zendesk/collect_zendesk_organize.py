@@ -1,7 +1,8 @@
-import csv
 import datetime
+import itertools
+import os
 import sys
-import time
+from contextlib import closing
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -10,6 +11,12 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from bs4 import BeautifulSoup
 
+# throttle.py is shared with the scrapers of the parent directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from throttle import Throttle
+from zendesk_pages import PageFetcher, parse_header
+import zendesk_store
+
 
 # args
 args = sys.argv
@@ -33,12 +40,17 @@ password = 'nishikiori@1'
 # log file
 current_date = datetime.datetime.now().strftime('%Y%m%d')
 log_name = "zendesk_organize_{}.csv".format(current_date)
+store_name = "zendesk_organize.db"     # tickets kept between the runs
 
 
 # selenium option
 _options = Options()
 _options.add_argument('--headless')
 
+# pacing of the pages
+throttle = Throttle(rate=4, burst=4, max_concurrency=4)
+
+
 # zendesk login
 driver = webdriver.Chrome(options=_options)
 driver.set_page_load_timeout(30)
@@ -51,90 +63,36 @@ login_button = driver.find_element_by_xpath('//*[@id="login-form"]/input[9]')
 login_button.click()
 
 # scraping first page
-driver.get('https://votiro.zendesk.com/hc/en-us/requests/organization')
+url = 'https://votiro.zendesk.com/hc/en-us/requests/organization'
+throttle.fetch(url, lambda: driver.get(url))
 page_source = driver.page_source
 soup = BeautifulSoup(page_source, 'lxml')
 
+# sync the store with the pages newest first, until the tickets are the same as in the last run
+# the browser has logged in by now, the pages after the first one are read over HTTP with its cookies
+fetcher = PageFetcher(driver, throttle)
+cutoff = datetime.datetime.now() - datetime.timedelta(days=days_to_collect)
+db = zendesk_store.open_store(store_name)
+if soup.find_all('table'):
+    zendesk_store.set_meta(db, 'header', parse_header(soup))
+# closing the pages stops the fetches ahead before the browser quits
+with closing(fetcher.iter_pages(url + "?page={}#requests", 2)) as next_pages:
+    pages = itertools.chain([soup], next_pages)
+    print('{} tickets are new or changed.'.format(zendesk_store.sync(db, pages, cutoff)))
+
+# output
 print('Writing to csv ...')
 try:
-    with open(log_name, 'w', encoding='utf-8_sig') as f:
-        writer = csv.writer(f, lineterminator='\n')
-        # title ('Subject', 'Id', 'Requester', 'Last activity', 'Status')
-        title = soup.find('table').find('thead').find('tr')
-        csv_data_title = []
-        csv_data_title.append(title.find_all('th')[0].text.strip())
-        csv_data_title.append(title.find_all('th')[1].text.strip())
-        csv_data_title.append(title.find_all('th')[2].text.strip())
-        title.find_all('th')[3].find('span').decompose()
-        csv_data_title.append(title.find_all('th')[3].text.strip())
-        csv_data_title.append(title.find_all('th')[4].text.strip())
-        writer.writerow(csv_data_title)
-
-        # recode
-        rows = soup.find('table').find('tbody').find_all('tr')
-        for row in rows:
-            csv_data = []
-            row.find_all('td')[0].find('div').decompose()
-            csv_data.append(row.find_all('td')[0].text.strip())
-            csv_data.append(row.find_all('td')[1].text.strip())
-            csv_data.append(row.find_all('td')[2].text.strip())
-            csv_data.append(row.find_all('td')[3].find('time')['title'])
-            csv_data.append(row.find_all('td')[4].text.strip())
-            print(csv_data)
-            writer.writerow(csv_data)
+    zendesk_store.write_csv(db, log_name, cutoff)
 except OSError as e:
     print('OS Error: {}'.format(e))
 else:
     print('Writing to csv is successfully ended.')
-
-time.sleep(1)
-
-
-# scraping second page and more
-counter = 2
-flag = False
-while True:
-    url = "https://votiro.zendesk.com/hc/en-us/requests/organization?page={}#requests".format(counter)
-    driver.get(url)
-    page_source = driver.page_source
-    soup = BeautifulSoup(page_source, 'lxml')
-    if soup.find_all('table'):
-        # print("This page is {}.".format(counter))
-        print('Writing to csv ...')
-        try:
-            with open(log_name, 'a', encoding='utf-8_sig') as f:
-                writer = csv.writer(f, lineterminator='\n')
-                rows = soup.find('table').find('tbody').find_all('tr')
-                for row in rows:
-                    now = datetime.datetime.now()
-                    record_time = row.find_all('td')[3].find('time')['title']
-                    if (datetime.datetime.strptime(record_time, '%Y-%m-%d %H:%M') + datetime.timedelta(days=days_to_collect)) <= now:
-                        flag = True
-                        break
-
-                    csv_data = []
-                    row.find_all('td')[0].find('div').decompose()
-                    csv_data.append(row.find_all('td')[0].text.strip())
-                    csv_data.append(row.find_all('td')[1].text.strip())
-                    csv_data.append(row.find_all('td')[2].text.strip())
-                    csv_data.append(record_time)
-                    csv_data.append(row.find_all('td')[4].text.strip())
-                    print(csv_data)
-                    writer.writerow(csv_data)
-        except OSError as e:
-            print('OS Error: {}'.format(e))
-        else:
-            print('Writing to csv is successfully ended.')
-            if flag:
-                break
-    else:
-        print("No requests found.")
-        break
-
-    time.sleep(1)
-    counter += 1
+db.close()
 
 
 # finalize
 driver.quit()
+throttle.print_stats()
+print('{} pages were rendered by the browser.'.format(fetcher.rendered))
 
@@ -0,0 +1,90 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from bs4 import BeautifulSoup
+
+# the request list pages are read over HTTP with the cookies of the logged in browser,
+# only the pages which can't be read so (e.g. the login expired or another domain) are rendered by the browser
+
+max_workers = 4     # pages fetched at the same time
+timeout = 30
+
+
+def make_session(driver):
+    # requests session with the cookies and the user agent of the browser
+    s = requests.Session()
+    # only connection errors are retried here, 429/5xx are retried by the throttle
+    retries = Retry(total=3, status=0, respect_retry_after_header=False)
+    adapter = HTTPAdapter(max_retries=retries, pool_connections=max_workers, pool_maxsize=max_workers)
+    s.mount('https://', adapter)
+    s.mount('http://', adapter)
+    s.headers['User-Agent'] = driver.execute_script('return navigator.userAgent')
+    for cookie in driver.get_cookies():
+        s.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+    return s
+
+
+class PageFetcher:
+    def __init__(self, driver, throttle):
+        self.driver = driver
+        self.throttle = throttle
+        self.session = make_session(driver)
+        self.driver_lock = threading.Lock()
+        self.rendered = 0
+
+    def get_soup(self, url):
+        try:
+            # a redirect goes to the login page
+            r = self.throttle.request(self.session, 'GET', url, timeout=timeout, allow_redirects=False)
+            if r.status_code == 200:
+                return BeautifulSoup(r.content, 'lxml')
+        except requests.exceptions.RequestException:
+            pass
+        with self.driver_lock:
+            self.throttle.fetch(url, lambda: self.driver.get(url))
+            self.rendered += 1
+            return BeautifulSoup(self.driver.page_source, 'lxml')
+
+    def iter_pages(self, url_format, first=1):
+        # soups of the pages first, first + 1, ... in order, the pages after the one asked for are fetched meanwhile
+        # a sync usually stops within a page or two, so it looks one page ahead more with each page read,
+        # up to max_workers; close the generator when done to stop the fetches ahead
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = deque()
+            page = first
+            read = 0
+            try:
+                while True:
+                    while len(futures) < min(read + 1, max_workers):
+                        futures.append(executor.submit(self.get_soup, url_format.format(page)))
+                        page += 1
+                    soup = futures.popleft().result()
+                    read += 1
+                    yield soup
+            finally:
+                # the caller stopped, don't fetch the pages ahead which haven't started,
+                # the executor waits for the ones which have
+                for future in futures:
+                    future.cancel()
+
+
+def parse_header(soup):
+    # titles of the request list ('Subject', 'Id', 'Created' or 'Requester', 'Last activity', 'Status')
+    title = soup.find('table').find('thead').find('tr')
+    title.find_all('th')[3].find('span').decompose()
+    return [th.text.strip() for th in title.find_all('th')[:5]]
+
+
+def parse_rows(soup):
+    # rows of the request list in the order of the header, newest last activity first
+    rows = []
+    for row in soup.find('table').find('tbody').find_all('tr'):
+        td = row.find_all('td')
+        td[0].find('div').decompose()
+        rows.append([td[0].text.strip(), td[1].text.strip(), td[2].text.strip(), td[3].find('time')['title'],
+                     td[4].text.strip()])
+    return rows
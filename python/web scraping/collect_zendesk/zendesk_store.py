@@ -0,0 +1,80 @@
+import csv
+import datetime
+import json
+import sqlite3
+
+from zendesk_pages import parse_rows
+
+# tickets of the request list kept between the runs, so a run reads only the pages changed since the last one
+# the list is sorted by last activity, newest first, the pages after a ticket which hasn't changed are the same
+
+time_format = '%Y-%m-%d %H:%M'    # last activity as the list shows it, sortable as text
+
+store_schema = """
+CREATE TABLE IF NOT EXISTS tickets (
+    Id TEXT PRIMARY KEY, Subject TEXT, Info TEXT, LastActivity TEXT, Status TEXT, Synced TEXT);
+CREATE INDEX IF NOT EXISTS tickets_last_activity ON tickets (LastActivity);
+CREATE TABLE IF NOT EXISTS meta (Key TEXT PRIMARY KEY, Value TEXT);
+"""
+
+
+def open_store(store_name):
+    db = sqlite3.connect(store_name)
+    db.executescript(store_schema)
+    return db
+
+
+def get_meta(db, key):
+    row = db.execute("SELECT Value FROM meta WHERE Key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def set_meta(db, key, value):
+    db.execute("INSERT OR REPLACE INTO meta (Key, Value) VALUES (?, ?)", (key, json.dumps(value)))
+
+
+def sync(db, pages, cutoff):
+    # store the new and changed tickets of pages (soups of the list pages from the first one), return the number of them
+    # it stops at a ticket older than cutoff, or at a ticket which is the same as stored when the store has
+    # every ticket back to cutoff ('covered', the oldest cutoff a sync reached, '' for the end of the list)
+    cutoff_text = cutoff.strftime(time_format)
+    covered = get_meta(db, 'covered')
+    stop_unchanged = covered is not None and covered <= cutoff_text
+    synced = datetime.datetime.now().strftime(time_format)
+    stored = 0
+    for soup in pages:
+        if not soup.find_all('table'):
+            print("No requests found.")
+            set_meta(db, 'covered', '')
+            break
+        unchanged = old = False
+        for subject, ticket_id, info, last_activity, status in parse_rows(soup):
+            if datetime.datetime.strptime(last_activity, time_format) <= cutoff:
+                old = True
+                break
+            row = db.execute("SELECT LastActivity, Status FROM tickets WHERE Id = ?", (ticket_id,)).fetchone()
+            if row == (last_activity, status):
+                # the rest of the page is read, a ticket with the same last activity may follow
+                unchanged = stop_unchanged
+                continue
+            db.execute("INSERT OR REPLACE INTO tickets (Id, Subject, Info, LastActivity, Status, Synced) "
+                       "VALUES (?, ?, ?, ?, ?, ?)", (ticket_id, subject, info, last_activity, status, synced))
+            print([subject, ticket_id, info, last_activity, status])
+            stored += 1
+        if old:
+            set_meta(db, 'covered', cutoff_text if covered is None else min(covered, cutoff_text))
+            break
+        if unchanged:
+            break
+    db.commit()
+    return stored
+
+
+def write_csv(db, log_name, cutoff):
+    # the tickets whose last activity is newer than cutoff, in the order of the list
+    with open(log_name, 'w', encoding='utf-8_sig') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(get_meta(db, 'header') or ['Subject', 'Id', '', 'Last activity', 'Status'])
+        writer.writerows(db.execute("SELECT Subject, Id, Info, LastActivity, Status FROM tickets "
+                                    "WHERE LastActivity > ? ORDER BY LastActivity DESC, Id DESC",
+                                    (cutoff.strftime(time_format),)))
@@ -0,0 +1,149 @@
+import sys
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+# pacing of the requests of the scrapers, shared by the scripts of this directory
+# each host has a token bucket, which limits the request rate, and a concurrency limit, which grows by one a round
+# on success and halves on 429/5xx (AIMD), a Retry-After or a backoff delay stops the requests to the host meanwhile
+
+retry_statuses = (429, 500, 502, 503, 504)
+
+
+def get_retry_after(response):
+    # seconds of the Retry-After header (seconds or HTTP-date), None if there's none
+    value = getattr(response, 'headers', {}).get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostLimit:
+    def __init__(self, rate, burst, max_concurrency):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.concurrency = 1.0
+        self.active = 0
+        self.blocked_until = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        # wait for a token and a free slot, return the seconds waited
+        start = time.monotonic()
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                elif self.active >= int(self.concurrency):
+                    delay = None    # until a request ends
+                elif self.tokens < 1:
+                    delay = (1 - self.tokens) / self.rate
+                else:
+                    self.tokens -= 1
+                    self.active += 1
+                    return now - start
+                self.condition.wait(delay)
+
+    def release(self, ok, delay=None):
+        with self.condition:
+            self.active -= 1
+            if ok:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            else:
+                self.concurrency = max(1.0, self.concurrency / 2)
+                if delay:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            self.condition.notify_all()
+
+
+class Throttle:
+    def __init__(self, rate=1.0, burst=1, max_concurrency=4, max_retries=3, backoff_factor=1.0, max_delay=60.0):
+        """
+        :param rate: requests per second to one host
+        :param burst: requests to one host which can be sent at once after an idle time
+        :param max_concurrency: upper limit of the requests to one host at the same time
+        :param max_retries: retries of a request answered with 429/5xx
+        :param backoff_factor: delay before the n-th retry is backoff_factor * 2 ** (n - 1) without Retry-After
+        :param max_delay: upper limit of the delay before a retry
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_delay = max_delay
+        self.hosts = {}
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.requests = 0
+        self.retries = 0
+        self.wait_secs = 0.0
+
+    def get_host(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostLimit(self.rate, self.burst, self.max_concurrency)
+            return self.hosts[host]
+
+    def fetch(self, url, func):
+        """
+        call func, which requests url, when the host allows it and retry it while it's answered with 429/5xx
+        an exception of func slows the host down and is raised again
+        :param func: function without arguments returning a response (with status_code) or anything else for success
+        :return: the last return value of func
+        """
+        host = self.get_host(url)
+        attempt = 0
+        while True:
+            waited = host.acquire()
+            with self.lock:
+                self.requests += 1
+                self.wait_secs += waited
+            try:
+                response = func()
+            except Exception:
+                host.release(False)
+                raise
+            if getattr(response, 'status_code', None) not in retry_statuses:
+                host.release(True)
+                return response
+            delay = get_retry_after(response)
+            if delay is None:
+                delay = self.backoff_factor * 2 ** attempt
+            host.release(False, min(delay, self.max_delay))
+            if attempt >= self.max_retries:
+                return response
+            response.close()
+            attempt += 1
+            with self.lock:
+                self.retries += 1
+
+    def request(self, session, method, url, **kwargs):
+        # session.request paced by the host of url
+        return self.fetch(url, lambda: session.request(method, url, **kwargs))
+
+    def get_stats(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            return {'requests': self.requests, 'retries': self.retries, 'wait_secs': round(self.wait_secs, 3),
+                    'elapsed_secs': round(elapsed, 3),
+                    'requests_per_sec': round(self.requests / elapsed, 2) if elapsed > 0 else 0.0}
+
+    def print_stats(self, file=sys.stdout):
+        print('{requests} requests in {elapsed_secs} s ({requests_per_sec}/s), {retries} retries, '
+              '{wait_secs} s waiting for the hosts'.format(**self.get_stats()), file=file)